@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+"""
+PIA (Private Internet Access) Port Forwarding Agent
+Resident service that keeps a PIA forwarded port bound and applied to Transmission
+
+Based on the official PIA manual-connections flow:
+  1. generateToken (VPN_USER/VPN_PASS)
+  2. getSignature on the gateway -> payload (port, expires_at) + signature
+  3. bindPort on the gateway, repeated at least every 15 minutes
+
+Requirements:
+- PIA_PORT_FORWARD=true environment variable
+- VPN_USER and VPN_PASS set (same as OpenVPN credentials)
+- Connected to a PIA server that supports port forwarding (NOT US servers)
+
+All HTTP calls (PIA token service, gateway API and Transmission RPC) share one
+pooled requests session. Transmission RPC goes through the TransmissionAPI
+client of transmission_rpc.py, which the metrics server uses as well. The agent
+state is written to PIA_PF_STATE_FILE for the metrics server to export.
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import logging
+import subprocess
+from datetime import datetime, timezone
+
+import requests
+from urllib3.exceptions import InsecureRequestWarning
+
+# Installed next to this script (connection settings come from the same TRANSMISSION_* variables)
+from transmission_rpc import TransmissionAPI
+
+# Configuration from environment variables
+PIA_PORT_FORWARD = os.getenv('PIA_PORT_FORWARD', 'false').lower() == 'true'
+VPN_USER = os.getenv('VPN_USER', '')
+VPN_PASS = os.getenv('VPN_PASS', '')
+VPN_INTERFACE_FILE = '/tmp/vpn_interface_name'
+
+PIA_TOKEN_URL = os.getenv('PIA_TOKEN_URL', 'https://privateinternetaccess.com/gtoken/generateToken')
+PIA_PF_GATEWAY = os.getenv('PIA_PF_GATEWAY', '')
+PIA_PF_API_PORT = int(os.getenv('PIA_PF_API_PORT', '19999'))
+PIA_PF_TIMEOUT = float(os.getenv('PIA_PF_TIMEOUT', '10'))
+PIA_PF_BIND_INTERVAL = int(os.getenv('PIA_PF_BIND_INTERVAL', '900'))
+PIA_PF_RENEW_BEFORE = int(os.getenv('PIA_PF_RENEW_BEFORE', '86400'))
+PIA_PF_RETRY_MAX = int(os.getenv('PIA_PF_RETRY_MAX', '300'))
+PIA_PF_BIND_FAILURES_BEFORE_RENEW = int(os.getenv('PIA_PF_BIND_FAILURES_BEFORE_RENEW', '2'))
+PIA_PF_PORT_TEST = os.getenv('PIA_PF_PORT_TEST', 'true').lower() == 'true'
+PIA_PF_STATE_FILE = os.getenv('PIA_PF_STATE_FILE', '/tmp/pia_port_forward.json')
+PIA_PF_SIGNATURE_FILE = os.getenv('PIA_PF_SIGNATURE_FILE', '/tmp/pia_pf_signature.json')
+PIA_PF_PORT_FILE = '/tmp/pia_forwarded_port'
+PIA_PF_KILLSWITCH = os.getenv('PIA_PF_KILLSWITCH', '/usr/local/bin/vpn-killswitch.sh')
+# Rewritten by every full kill switch apply
+PIA_PF_KILLSWITCH_STATUS = '/tmp/killswitch_status'
+
+# Stages a cycle can fail in; exported as failure counters ('state': local files)
+STAGES = ('gateway', 'token', 'signature', 'bind', 'rpc', 'port_test', 'firewall', 'state')
+
+# Setup logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='[PIA-PF] %(asctime)s %(levelname)s %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S'
+)
+logger = logging.getLogger(__name__)
+
+class PortForwardError(Exception):
+    """A port forwarding cycle failed in the given stage"""
+
+    def __init__(self, stage, message):
+        super().__init__(message)
+        self.stage = stage
+
+def detect_gateway():
+    """PIA gateway: the next hop of the routes through the VPN interface"""
+    if PIA_PF_GATEWAY:
+        return PIA_PF_GATEWAY
+    try:
+        with open(VPN_INTERFACE_FILE) as f:
+            interface = f.read().strip()
+    except OSError:
+        raise PortForwardError('gateway', "VPN interface file not found. Is VPN connected?")
+
+    for command in (['ip', 'route', 'show', 'dev', interface], ['ip', 'route']):
+        try:
+            output = subprocess.run(command, capture_output=True, text=True, timeout=5).stdout
+        except (OSError, subprocess.SubprocessError):
+            continue
+        for line in output.splitlines():
+            fields = line.split()
+            if 'via' in fields and (command[-1] == interface or f"dev {interface}" in line):
+                return fields[fields.index('via') + 1]
+    raise PortForwardError('gateway', f"Could not determine PIA gateway IP on {interface}")
+
+def decode_payload(payload):
+    """Port and expiry (epoch seconds) from the base64 JSON signature payload"""
+    data = json.loads(base64.b64decode(payload))
+    # e.g. 2024-05-01T12:00:00.123456789Z (UTC, nanosecond fraction)
+    expires = datetime.strptime(data['expires_at'][:19], '%Y-%m-%dT%H:%M:%S')
+    return int(data['port']), expires.replace(tzinfo=timezone.utc).timestamp()
+
+def killswitch_ruleset():
+    """Identifies the loaded kill switch ruleset: the status file's mtime, or None"""
+    try:
+        return os.stat(PIA_PF_KILLSWITCH_STATUS).st_mtime_ns
+    except OSError:
+        return None
+
+def renew_time(expires_at, now):
+    """When to fetch a new signature: PIA_PF_RENEW_BEFORE ahead of expiry, or
+    half-way through a signature that is shorter-lived than that"""
+    return expires_at - min(PIA_PF_RENEW_BEFORE, max(0, expires_at - now) / 2)
+
+class PortForwardAgent:
+    """Obtains, binds and applies a PIA forwarded port on a schedule"""
+
+    def __init__(self, session=None, api=None):
+        # One pooled client for the token service, the gateway and Transmission
+        self.session = session or requests.Session()
+        self.api = api or TransmissionAPI(session=self.session, timeout=PIA_PF_TIMEOUT)
+        self.gateway = None
+        self.payload = None
+        self.signature = None
+        self.port = None
+        self.expires_at = 0
+        self.renew_at = 0
+        self.port_since = None
+        self.applied_port = None
+        self.firewall_port = None
+        self.firewall_ruleset = None
+        self.port_open = None
+        self.last_bind = 0
+        self.bind_latency = None
+        self.binds = 0
+        self.failures = {stage: 0 for stage in STAGES}
+        self.consecutive_failures = 0
+        self.bind_failures = 0
+
+    def _gateway_url(self, path):
+        return f"https://{self.gateway}:{PIA_PF_API_PORT}/{path}"
+
+    def _gateway_get(self, stage, path, params):
+        # The gateway presents a self-signed certificate on the tunnel (curl -k before)
+        try:
+            response = self.session.get(self._gateway_url(path), params=params,
+                                        timeout=PIA_PF_TIMEOUT, verify=False)
+            data = response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise PortForwardError(stage, f"{path} request failed: {e}")
+        if data.get('status') != 'OK':
+            raise PortForwardError(stage, f"{path} returned {data}")
+        return data
+
+    def load_signature(self):
+        """Reuse a saved signature for the same gateway so restarts keep the port"""
+        try:
+            with open(PIA_PF_SIGNATURE_FILE) as f:
+                saved = json.load(f)
+            port, expires_at = decode_payload(saved['payload'])
+            signature, renew_at = saved['signature'], saved['renew_at']
+        except (OSError, ValueError, KeyError, TypeError):
+            return False
+        if saved.get('gateway') != self.gateway or time.time() >= renew_at:
+            return False
+        self.payload, self.signature = saved['payload'], signature
+        self.port, self.expires_at, self.renew_at = port, expires_at, renew_at
+        self.port_since = saved.get('port_since', time.time())
+        self.last_bind = 0
+        logger.info(f"Reusing saved signature for port {port} (expires {datetime.fromtimestamp(expires_at)})")
+        return True
+
+    def save_signature(self):
+        fd = os.open(PIA_PF_SIGNATURE_FILE, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'gateway': self.gateway, 'payload': self.payload,
+                       'signature': self.signature, 'port_since': self.port_since,
+                       'renew_at': self.renew_at}, f)
+
+    def refresh_signature(self):
+        """Fetch a token and a new signature (and with it possibly a new port)"""
+        self.gateway = detect_gateway()
+        logger.info(f"Detected PIA gateway: {self.gateway}")
+        if self.load_signature():
+            return
+
+        try:
+            response = self.session.get(PIA_TOKEN_URL, auth=(VPN_USER, VPN_PASS), timeout=PIA_PF_TIMEOUT)
+            token = response.json().get('token')
+        except (requests.RequestException, ValueError) as e:
+            raise PortForwardError('token', f"Token request failed: {e}")
+        if not token:
+            raise PortForwardError('token', f"Failed to get PIA token (HTTP {response.status_code}). "
+                                            "Check VPN_USER/VPN_PASS.")
+
+        try:
+            data = self._gateway_get('signature', 'getSignature', {'token': token})
+        except PortForwardError:
+            logger.error("No port forwarding signature. US servers and some regions do not support "
+                         "port forwarding; try e.g. CA Toronto, Netherlands, Switzerland or Germany.")
+            raise
+        try:
+            port, expires_at = decode_payload(data['payload'])
+        except (ValueError, KeyError) as e:
+            raise PortForwardError('signature', f"Could not decode signature payload: {e}")
+
+        if port != self.port:
+            self.port_since = time.time()
+        self.payload, self.signature = data['payload'], data['signature']
+        self.port, self.expires_at = port, expires_at
+        self.renew_at = renew_time(expires_at, time.time())
+        self.last_bind = 0
+        self.bind_failures = 0
+        self.save_signature()
+        logger.info(f"Port forwarding enabled! Forwarded port: {port} "
+                    f"(expires {datetime.fromtimestamp(expires_at)})")
+
+    def bind(self):
+        """bindPort keepalive; PIA drops the port if this lapses for 15 minutes"""
+        started = time.perf_counter()
+        try:
+            self._gateway_get('bind', 'bindPort', {'payload': self.payload, 'signature': self.signature})
+        except PortForwardError:
+            self.bind_failures += 1
+            if self.bind_failures >= PIA_PF_BIND_FAILURES_BEFORE_RENEW:
+                # Gateway changed (VPN reconnect) or the binding lapsed: start over
+                logger.warning("Port binding keeps failing, requesting a new signature")
+                self.payload = None
+                try:
+                    os.remove(PIA_PF_SIGNATURE_FILE)
+                except OSError:
+                    pass
+            raise
+        self.bind_latency = time.perf_counter() - started
+        self.last_bind = time.time()
+        self.binds += 1
+        self.bind_failures = 0
+        logger.info(f"Port binding refreshed in {self.bind_latency * 1000:.0f} ms. Port {self.port} active.")
+
+    def rpc(self, method, arguments=None):
+        """Transmission RPC call through the shared client"""
+        result = self.api._make_request(method, arguments)
+        if not result or result.get('result') != 'success':
+            raise PortForwardError('rpc', f"Transmission RPC {method} failed: "
+                                          f"{result.get('result') if result else 'no response'}")
+        return result.get('arguments', {})
+
+    def killswitch(self, op, port):
+        """Returns False if the kill switch script failed"""
+        if not os.access(PIA_PF_KILLSWITCH, os.X_OK):
+            return True
+        result = subprocess.run([PIA_PF_KILLSWITCH, f"{op}-peer-port", str(port)],
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            self.failures['firewall'] += 1
+            logger.warning(f"Kill switch {op}-peer-port {port} failed: {result.stderr.strip()}")
+            return False
+        return True
+
+    def apply_port(self):
+        """Open the port on the VPN interface and set it as Transmission's peer port"""
+        # Only when the port changed or a full kill switch apply rebuilt the ruleset since
+        ruleset = killswitch_ruleset()
+        if self.firewall_port != self.port or self.firewall_ruleset != ruleset:
+            if self.firewall_port and self.firewall_port != self.port:
+                self.killswitch('revoke', self.firewall_port)
+            with open(PIA_PF_PORT_FILE, 'w') as f:
+                f.write(f"{self.port}\n")
+            if self.killswitch('allow', self.port):
+                self.firewall_port = self.port
+                self.firewall_ruleset = ruleset
+            else:
+                self.firewall_port = None  # Retried on the next pass
+
+        if self.applied_port != self.port:
+            self.rpc('session-set', {'peer-port': self.port})
+            self.applied_port = self.port
+            self.port_open = None
+            logger.info(f"Successfully set Transmission peer port to {self.port}")
+
+        if PIA_PF_PORT_TEST and not self.port_open:
+            self.port_open = bool(self.rpc('port-test').get('port-is-open'))
+            if not self.port_open:
+                raise PortForwardError('port_test', f"Port {self.port} is not reachable yet (port-test)")
+            logger.info(f"Port {self.port} confirmed open by port-test")
+
+    def next_bind_delay(self, now):
+        # Keep-alive interval, but wake up in time to renew before the signature expires
+        return max(0, min(self.last_bind + PIA_PF_BIND_INTERVAL, self.renew_at) - now)
+
+    def cycle(self):
+        """One scheduling step; returns the seconds until the next one"""
+        try:
+            if self.payload is None or time.time() >= self.renew_at:
+                self.refresh_signature()
+            if time.time() >= self.last_bind + PIA_PF_BIND_INTERVAL:
+                self.bind()
+            self.apply_port()
+            self.consecutive_failures = 0
+            delay = self.next_bind_delay(time.time())
+        except PortForwardError as e:
+            delay = self.failed(e.stage, e)
+        except (OSError, ValueError, KeyError) as e:
+            # Local files (signature, port file) or an unexpected response shape
+            delay = self.failed('state', e)
+        self.write_state()
+        return delay
+
+    def failed(self, stage, error):
+        """Count a failed cycle; returns the backoff delay"""
+        self.failures[stage] += 1
+        self.consecutive_failures += 1
+        delay = min(PIA_PF_RETRY_MAX, 5 * 2 ** (self.consecutive_failures - 1))
+        logger.warning(f"{error} (stage {stage}), retrying in {delay}s")
+        return delay
+
+    def write_state(self):
+        """Agent state for the metrics server (no secrets)"""
+        state = {
+            'port': self.port,
+            'gateway': self.gateway,
+            'port_since': self.port_since,
+            'expires_at': self.expires_at or None,
+            'last_bind': self.last_bind or None,
+            'bind_latency_seconds': self.bind_latency,
+            'binds_total': self.binds,
+            'failures_total': self.failures,
+            'port_open': self.port_open,
+            'applied': self.applied_port is not None and self.applied_port == self.port,
+            'updated': time.time()
+        }
+        tmp_path = f"{PIA_PF_STATE_FILE}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(state, f)
+            os.replace(tmp_path, PIA_PF_STATE_FILE)
+        except OSError as e:
+            logger.error(f"Failed to write state file {PIA_PF_STATE_FILE}: {e}")
+
+    def run(self):
+        while True:
+            time.sleep(self.cycle())
+
+def main():
+    if not PIA_PORT_FORWARD:
+        logger.info("PIA port forwarding not enabled (PIA_PORT_FORWARD != true). Exiting.")
+        return 0
+    if not VPN_USER or not VPN_PASS:
+        logger.error("VPN_USER and VPN_PASS must be set for PIA port forwarding.")
+        return 1
+
+    requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
+    logger.info("Starting PIA port forwarding agent...")
+    PortForwardAgent().run()
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,6 +1,6 @@
 #!/command/with-contenv bash
 # Enhanced VPN Kill Switch Script
-# Implements strict iptables rules to prevent any IP leaks
+# Implements strict iptables (or nftables) rules to prevent any IP leaks
 # Called by vpn-setup.sh and vpn-monitor service
 
 set -e
@@ -8,6 +8,13 @@ set -e
 # Configuration
 VPN_INTERFACE_FILE="/tmp/vpn_interface_name"
 KILLSWITCH_STATUS="/tmp/killswitch_status"
+# iptables (default) or nftables: one atomic ruleset with named sets for addresses and ports
+KILLSWITCH_BACKEND="${KILLSWITCH_BACKEND:-iptables}"
+NFT_TABLE="inet killswitch"
+NFT_RULESET_FILE="${NFT_RULESET_FILE:-/tmp/killswitch.nft}"
+# Runtime allow-* entries ("<kind> <args>" per line), re-applied by every apply
+KILLSWITCH_ALLOWLIST_FILE="${KILLSWITCH_ALLOWLIST_FILE:-/tmp/killswitch_allowlist}"
+PIA_PF_PORT_FILE="/tmp/pia_forwarded_port"
 
 log() {
     echo "[KILLSWITCH] $(date '+%Y-%m-%d %H:%M:%S') $*"
@@ -28,6 +35,322 @@ get_vpn_interface() {
     fi
 }
 
+use_nftables() {
+    [ "${KILLSWITCH_BACKEND,,}" = "nftables" ] || return 1
+    if ! command -v nft >/dev/null 2>&1; then
+        log "WARNING: KILLSWITCH_BACKEND=nftables but nft is not installed, falling back to iptables"
+        return 1
+    fi
+    return 0
+}
+
+privoxy_enabled() {
+    [ "${ENABLE_PRIVOXY,,}" = "yes" ] || [ "${ENABLE_PRIVOXY,,}" = "true" ]
+}
+
+# Route replies of LAN-facing services (fwmark 0x1) via the eth0 gateway (table 100)
+ensure_lan_routing() {
+    local eth0_gateway=$(ip route | grep default | grep eth0 | awk '{print $3}')
+    if [ -z "$eth0_gateway" ]; then
+        eth0_gateway=$(ip route show dev eth0 2>/dev/null | awk '/default via/ {print $3}')
+    fi
+    if [ -z "$eth0_gateway" ]; then
+        log "WARNING: Could not determine eth0 gateway, skipping policy-based routing setup"
+        return 1
+    fi
+
+    log "Setting up policy-based routing for LAN services via gateway: $eth0_gateway"
+    if ! ip route show table 100 | grep -q "default via $eth0_gateway"; then
+        ip route add default via "$eth0_gateway" dev eth0 table 100 2>/dev/null || \
+            ip route replace default via "$eth0_gateway" dev eth0 table 100
+        log "Added/updated route in table 100: default via $eth0_gateway dev eth0"
+    fi
+    if ! ip rule list | grep -q "fwmark 0x1 lookup 100"; then
+        ip rule add fwmark 0x1 lookup 100 priority 1000
+        log "Added ip rule for fwmark 0x1 -> table 100"
+    fi
+    return 0
+}
+
+# Join arguments into an nft element list, skipping empty and repeated values
+nft_elements() {
+    local out="" item
+    for item in "$@"; do
+        [ -n "$item" ] || continue
+        case ", $out, " in
+            *", $item, "*) ;;
+            *) out="${out:+$out, }$item" ;;
+        esac
+    done
+    echo "$out"
+}
+
+# Arguments of the persisted runtime entries of one kind, one entry per line
+allowlist_entries() {
+    [ -f "$KILLSWITCH_ALLOWLIST_FILE" ] || return 0
+    awk -v kind="$1" '$1 == kind { $1 = ""; sub(/^ /, ""); print }' "$KILLSWITCH_ALLOWLIST_FILE"
+}
+
+# Record or forget a runtime entry so a full re-apply keeps it
+persist_allowlist() {
+    local op="$1" entry="$2"
+    local kept
+    kept=$(grep -vxF -- "$entry" "$KILLSWITCH_ALLOWLIST_FILE" 2>/dev/null || true)
+    {
+        [ -n "$kept" ] && echo "$kept"
+        [ "$op" = "allow" ] && echo "$entry"
+    } > "$KILLSWITCH_ALLOWLIST_FILE.tmp"
+    mv "$KILLSWITCH_ALLOWLIST_FILE.tmp" "$KILLSWITCH_ALLOWLIST_FILE"
+}
+
+# Peer ports opened at runtime: the PIA forwarded port and allow-peer-port entries
+runtime_peer_ports() {
+    [ -f "$PIA_PF_PORT_FILE" ] && cat "$PIA_PF_PORT_FILE"
+    allowlist_entries peer-port
+}
+
+# Print a named set; the elements line is omitted for an empty set
+nft_set() {
+    local name="$1" type="$2" flags="$3" elements="$4"
+    echo "    set $name {"
+    echo "        type $type"
+    [ -n "$flags" ] && echo "        flags $flags"
+    [ -n "$elements" ] && echo "        elements = { $elements }"
+    echo "    }"
+}
+
+render_nft_ruleset() {
+    local vpn_if="$1"
+    local vpn_server="$2"
+    local vpn_port="$3"
+    local vpn_proto="${4:-udp}"
+
+    local service_ports="9091"
+    if [ "${METRICS_ENABLED,,}" = "true" ]; then
+        service_ports="$service_ports ${METRICS_PORT:-9099}"
+    fi
+    if privoxy_enabled; then
+        service_ports="$service_ports ${PRIVOXY_PORT:-8118}"
+    fi
+
+    local endpoints=()
+    local bootstrap_dns=""
+    if [ -n "$vpn_server" ] && [ -n "$vpn_port" ]; then
+        endpoints+=("$vpn_server . $vpn_proto . $vpn_port")
+        # Temporary DNS for VPN hostname resolution; the element expires on its own
+        bootstrap_dns='"eth0" timeout 10s'
+    fi
+
+    # Entries added at runtime with allow-* survive the re-render
+    local server port proto name
+    while read -r server port proto; do
+        endpoints+=("$server . ${proto:-udp} . $port")
+    done < <(allowlist_entries endpoint)
+    local interfaces=()
+    [ -n "$vpn_if" ] && interfaces+=("\"$vpn_if\"")
+    while read -r name; do
+        interfaces+=("\"$name\"")
+    done < <(allowlist_entries vpn-interface)
+
+    # Declaring and then deleting the table lets one load replace it in a single transaction
+    echo "table $NFT_TABLE"
+    echo "delete table $NFT_TABLE"
+    echo "table $NFT_TABLE {"
+    nft_set lan_networks ipv4_addr interval "$(nft_elements ${LAN_NETWORK//,/ } $(allowlist_entries lan))"
+    nft_set vpn_endpoints "ipv4_addr . inet_proto . inet_service" "" "$(nft_elements "${endpoints[@]}")"
+    nft_set vpn_interfaces ifname "" "$(nft_elements "${interfaces[@]}")"
+    nft_set lan_service_ports inet_service "" "$(nft_elements $service_ports)"
+    nft_set peer_ports inet_service "" "$(nft_elements $TRANSMISSION_PEER_PORT $(runtime_peer_ports))"
+    nft_set bootstrap_dns ifname timeout "$bootstrap_dns"
+    cat <<'EOF'
+
+    chain input {
+        type filter hook input priority filter; policy drop;
+        iifname "eth0" meta l4proto { tcp, udp } th dport @peer_ports drop
+        iifname "lo" accept
+        ct state established,related accept
+        iifname @vpn_interfaces meta l4proto { tcp, udp } th dport @peer_ports accept
+        iifname "eth0" tcp dport @lan_service_ports accept
+        iifname "eth0" ip saddr @lan_networks accept
+    }
+
+    chain output {
+        type filter hook output priority filter; policy drop;
+        oifname @bootstrap_dns meta l4proto { tcp, udp } th dport 53 accept
+        oifname "lo" accept
+        ct state established,related accept
+        meta l4proto { tcp, udp } th dport 53 oifname != @vpn_interfaces drop
+        oifname "eth0" ip daddr . meta l4proto . th dport @vpn_endpoints accept
+        oifname @vpn_interfaces accept
+        oifname "eth0" tcp sport @lan_service_ports accept
+        oifname "eth0" ip daddr @lan_networks accept
+    }
+
+    chain forward {
+        type filter hook forward priority filter; policy drop;
+        ct state established,related accept
+        iifname @vpn_interfaces accept
+        oifname @vpn_interfaces accept
+    }
+
+    chain lan_service_mark {
+        type filter hook prerouting priority mangle; policy accept;
+        iifname "eth0" tcp dport @lan_service_ports ct mark set 0x1
+    }
+
+    chain lan_service_restore {
+        type route hook output priority mangle; policy accept;
+        tcp sport @lan_service_ports meta mark set ct mark
+    }
+}
+EOF
+}
+
+apply_nft_killswitch() {
+    log "Applying strict kill switch rules (nftables)"
+
+    render_nft_ruleset "$@" > "$NFT_RULESET_FILE"
+    # nft -f loads the file as one transaction: every rule applies or none does
+    nft -f "$NFT_RULESET_FILE"
+    log "Loaded $NFT_RULESET_FILE into table $NFT_TABLE"
+
+    ensure_lan_routing || true
+
+    echo "active" > "$KILLSWITCH_STATUS"
+    log "Kill switch applied - nftables table $NFT_TABLE"
+}
+
+emergency_nft_killswitch() {
+    log "EMERGENCY: Applying emergency kill switch (nftables) - blocking ALL traffic"
+
+    nft -f - <<EOF
+table $NFT_TABLE
+delete table $NFT_TABLE
+table $NFT_TABLE {
+    chain input {
+        type filter hook input priority filter; policy drop;
+        iifname "lo" accept
+        iifname "eth0" tcp dport 9091 accept
+    }
+    chain output {
+        type filter hook output priority filter; policy drop;
+        oifname "lo" accept
+        oifname "eth0" tcp sport 9091 accept
+    }
+    chain forward {
+        type filter hook forward priority filter; policy drop;
+    }
+}
+EOF
+
+    echo "emergency" > "$KILLSWITCH_STATUS"
+    log "Emergency kill switch active - only loopback and UI access allowed"
+}
+
+verify_nft_killswitch() {
+    log "Verifying kill switch configuration (nftables)"
+
+    local chain
+    for chain in input output forward; do
+        if ! nft list chain $NFT_TABLE $chain 2>/dev/null | grep -q "policy drop"; then
+            log "WARNING: Chain $chain in table $NFT_TABLE missing or not policy drop!"
+            return 1
+        fi
+    done
+
+    if ! nft list chain $NFT_TABLE output | grep -q "dport 53 .*drop"; then
+        log "WARNING: DNS leak prevention rule not found!"
+        return 1
+    fi
+
+    local vpn_if=$(get_vpn_interface)
+    if [ -n "$vpn_if" ]; then
+        if ! nft list set $NFT_TABLE vpn_interfaces | grep -q "\"$vpn_if\""; then
+            log "WARNING: VPN interface $vpn_if not in vpn_interfaces set!"
+            return 1
+        fi
+    fi
+
+    log "Kill switch verification: PASSED"
+    return 0
+}
+
+# Idempotent iptables rule change: append unless present, delete if present
+iptables_rule() {
+    local op="$1"
+    shift
+    if [ "$op" = "revoke" ]; then
+        iptables -D "$@" 2>/dev/null || true
+    else
+        iptables -C "$@" 2>/dev/null || iptables -A "$@"
+    fi
+}
+
+# Add or remove the iptables rules for one allowlist entry
+iptables_allowlist() {
+    local op="$1" kind="$2"
+    shift 2
+
+    case "$kind" in
+        endpoint)
+            iptables_rule "$op" OUTPUT -o eth0 -d "$1" -p "${3:-udp}" --dport "$2" -j ACCEPT
+            ;;
+        peer-port)
+            local vpn_if=$(get_vpn_interface)
+            if [ -z "$vpn_if" ]; then
+                log "WARNING: No VPN interface yet, peer port $1 is opened on the next apply"
+                return 0
+            fi
+            iptables_rule "$op" INPUT -i "$vpn_if" -p tcp --dport "$1" -j ACCEPT
+            iptables_rule "$op" INPUT -i "$vpn_if" -p udp --dport "$1" -j ACCEPT
+            ;;
+        lan)
+            iptables_rule "$op" INPUT -i eth0 -s "$1" -j ACCEPT
+            iptables_rule "$op" OUTPUT -o eth0 -d "$1" -j ACCEPT
+            ;;
+        vpn-interface)
+            iptables_rule "$op" OUTPUT -o "$1" -j ACCEPT
+            ;;
+    esac
+}
+
+# Incremental allowlist updates: set elements on nftables, single rules on iptables.
+# Entries are persisted so that apply re-creates them.
+update_allowlist() {
+    local op="$1" kind="$2"
+    shift 2
+
+    persist_allowlist "$op" "$kind $*"
+    if use_nftables; then
+        local verb="add"
+        [ "$op" = "revoke" ] && verb="delete"
+        case "$kind" in
+            endpoint) nft $verb element $NFT_TABLE vpn_endpoints "{ $1 . ${3:-udp} . $2 }" ;;
+            peer-port) nft $verb element $NFT_TABLE peer_ports "{ $1 }" ;;
+            lan) nft $verb element $NFT_TABLE lan_networks "{ $1 }" ;;
+            vpn-interface) nft $verb element $NFT_TABLE vpn_interfaces "{ \"$1\" }" ;;
+        esac
+    else
+        iptables_allowlist "$op" "$kind" "$@"
+    fi
+    log "${op^}: $kind $*"
+}
+
+# Re-create the runtime entries after a full iptables apply
+replay_iptables_allowlist() {
+    local kind args port
+    if [ -f "$KILLSWITCH_ALLOWLIST_FILE" ]; then
+        while read -r kind args; do
+            [ -n "$kind" ] && iptables_allowlist allow "$kind" $args
+        done < "$KILLSWITCH_ALLOWLIST_FILE"
+    fi
+    if [ -f "$PIA_PF_PORT_FILE" ]; then
+        port=$(cat "$PIA_PF_PORT_FILE")
+        [ -n "$port" ] && iptables_allowlist allow peer-port "$port"
+    fi
+    return 0
+}
+
 apply_strict_killswitch() {
     local vpn_if="$1"
     local vpn_server="$2"
@@ -125,29 +448,10 @@ apply_strict_killswitch() {
     fi
 
     # === POLICY-BASED ROUTING FOR LAN-ACCESSIBLE SERVICES ===
-    # Get eth0 gateway and IP for policy routing
-    local eth0_gateway=$(ip route | grep default | grep eth0 | awk '{print $3}')
-    if [ -z "$eth0_gateway" ]; then
-        eth0_gateway=$(ip route show dev eth0 | awk '/default via/ {print $3}')
-    fi
+    # Get eth0 IP for the CONNMARK rules (routing table 100 is set up by ensure_lan_routing)
     local eth0_ip=$(ip -4 addr show dev eth0 | awk '/inet/ {print $2}' | cut -d/ -f1)
 
-    if [ -n "$eth0_gateway" ]; then
-        log "Setting up policy-based routing for LAN services via gateway: $eth0_gateway"
-
-        # Ensure routing table 100 exists with route to eth0 gateway
-        if ! ip route show table 100 | grep -q "default via $eth0_gateway"; then
-            ip route add default via "$eth0_gateway" dev eth0 table 100 2>/dev/null || \
-                ip route replace default via "$eth0_gateway" dev eth0 table 100
-            log "Added/updated route in table 100: default via $eth0_gateway dev eth0"
-        fi
-
-        # Ensure fwmark rule exists for table 100
-        if ! ip rule list | grep -q "fwmark 0x1 lookup 100"; then
-            ip rule add fwmark 0x1 lookup 100 priority 1000
-            log "Added ip rule for fwmark 0x1 -> table 100"
-        fi
-
+    if ensure_lan_routing; then
         # CONNMARK rules for Transmission UI (port 9091)
         if [ -n "$eth0_ip" ]; then
             iptables -t mangle -A PREROUTING -d "$eth0_ip" -p tcp --dport 9091 -j CONNMARK --set-mark 0x1
@@ -178,8 +482,6 @@ apply_strict_killswitch() {
             iptables -t mangle -A OUTPUT -p tcp --sport "${PRIVOXY_PORT:-8118}" -j CONNMARK --restore-mark
             log "Applied CONNMARK rules for Privoxy (port ${PRIVOXY_PORT:-8118})"
         fi
-    else
-        log "WARNING: Could not determine eth0 gateway, skipping policy-based routing setup"
     fi
 
     # === FORWARD CHAIN ===
@@ -207,6 +509,9 @@ apply_strict_killswitch() {
         log "BitTorrent port $TRANSMISSION_PEER_PORT restricted to VPN only"
     fi
 
+    # Forwarded port and other allow-* entries added since the last apply
+    replay_iptables_allowlist
+
     # Log the final rules count
     local input_rules=$(iptables -L INPUT -n | wc -l)
     local output_rules=$(iptables -L OUTPUT -n | wc -l)
@@ -283,6 +588,21 @@ verify_killswitch() {
     return 0
 }
 
+# nftables set elements need addresses; resolve a hostname the way iptables would
+resolve_ipv4() {
+    if [[ "$1" =~ ^[0-9]+(\.[0-9]+){3}$ ]] || [ -z "$1" ]; then
+        echo "$1"
+        return 0
+    fi
+    local address
+    address=$(getent ahostsv4 "$1" 2>/dev/null | awk '{print $1; exit}')
+    if [ -z "$address" ]; then
+        log "WARNING: Could not resolve $1 to an IPv4 address" >&2
+        return 1
+    fi
+    echo "$address"
+}
+
 # Main execution
 case "${1:-apply}" in
     apply)
@@ -290,15 +610,55 @@ case "${1:-apply}" in
         VPN_SERVER="${2:-}"
         VPN_PORT="${3:-}"
         VPN_PROTO="${4:-udp}"
-        apply_strict_killswitch "$VPN_INTERFACE" "$VPN_SERVER" "$VPN_PORT" "$VPN_PROTO"
+        if use_nftables; then
+            VPN_ADDRESS=$(resolve_ipv4 "$VPN_SERVER") || \
+                log "WARNING: VPN endpoint $VPN_SERVER:$VPN_PORT is not allowlisted and bootstrap DNS stays closed"
+            apply_nft_killswitch "$VPN_INTERFACE" "$VPN_ADDRESS" "$VPN_PORT" "$VPN_PROTO"
+        else
+            apply_strict_killswitch "$VPN_INTERFACE" "$VPN_SERVER" "$VPN_PORT" "$VPN_PROTO"
+        fi
+        ;;
+
+    render)
+        VPN_ADDRESS=$(resolve_ipv4 "${2:-}") || log "WARNING: Rendering without the VPN endpoint and bootstrap DNS" >&2
+        render_nft_ruleset "$(get_vpn_interface)" "$VPN_ADDRESS" "${3:-}" "${4:-udp}"
+        ;;
+
+    allow-endpoint|revoke-endpoint)
+        [ -n "$2" ] && [ -n "$3" ] || { echo "Usage: $0 $1 <server> <port> [proto]"; exit 1; }
+        VPN_ADDRESS=$(resolve_ipv4 "$2") || exit 1
+        update_allowlist "${1%%-*}" endpoint "$VPN_ADDRESS" "$3" "${4:-udp}"
+        ;;
+
+    allow-peer-port|revoke-peer-port)
+        [ -n "$2" ] || { echo "Usage: $0 $1 <port>"; exit 1; }
+        update_allowlist "${1%%-*}" peer-port "$2"
+        ;;
+
+    allow-lan|revoke-lan)
+        [ -n "$2" ] || { echo "Usage: $0 $1 <cidr>"; exit 1; }
+        update_allowlist "${1%%-*}" lan "$2"
+        ;;
+
+    allow-interface|revoke-interface)
+        [ -n "$2" ] || { echo "Usage: $0 $1 <interface>"; exit 1; }
+        update_allowlist "${1%%-*}" vpn-interface "$2"
         ;;
 
     emergency)
-        emergency_killswitch
+        if use_nftables; then
+            emergency_nft_killswitch
+        else
+            emergency_killswitch
+        fi
         ;;
 
     verify)
-        verify_killswitch
+        if use_nftables; then
+            verify_nft_killswitch
+        else
+            verify_killswitch
+        fi
         exit $?
         ;;
 
@@ -309,21 +669,32 @@ case "${1:-apply}" in
             echo "Kill switch status: unknown"
         fi
 
-        echo "Current firewall policies:"
-        iptables -S | grep "^-P"
+        if use_nftables; then
+            echo "nftables table $NFT_TABLE:"
+            nft list table $NFT_TABLE 2>/dev/null | grep -E "policy|elements" || echo "  Table not loaded"
+        else
+            echo "Current firewall policies:"
+            iptables -S | grep "^-P"
 
-        echo "DNS leak prevention:"
-        iptables -L OUTPUT -n | grep "dpt:53" || echo "  No DNS rules found"
+            echo "DNS leak prevention:"
+            iptables -L OUTPUT -n | grep "dpt:53" || echo "  No DNS rules found"
+        fi
 
         echo "VPN interface: $(get_vpn_interface)"
         ;;
 
     *)
-        echo "Usage: $0 [apply|emergency|verify|status]"
+        echo "Usage: $0 [apply|emergency|verify|status|render|allow-*|revoke-*]"
         echo "  apply    - Apply kill switch with VPN configuration"
         echo "  emergency - Apply emergency kill switch (block all)"
         echo "  verify   - Verify kill switch is properly configured"
         echo "  status   - Show current kill switch status"
+        echo "  render   - Print the nftables ruleset without loading it"
+        echo "  allow-endpoint|revoke-endpoint <server> <port> [proto] - VPN server allowlist"
+        echo "  allow-peer-port|revoke-peer-port <port> - Peer port reachable through the VPN"
+        echo "  allow-lan|revoke-lan <cidr>             - LAN network allowlist"
+        echo "  allow-interface|revoke-interface <name> - VPN interface allowlist"
+        echo "  Set KILLSWITCH_BACKEND=nftables to use one atomic nftables ruleset with named sets"
         exit 1
         ;;
 esac
\ No newline at end of file
@@ -436,6 +436,61 @@ while true; do
 done
 echo "[INFO] VPN interface $VPN_INTERFACE is active."
 
+# VPN server endpoint, allowed out on eth0 by the kill switch
+VPN_SERVER=""
+VPN_PORT=""
+VPN_PROTO="udp"
+if [ "${VPN_CLIENT,,}" = "openvpn" ] && [ -f "$OVPN_CONFIG_FILE" ]; then
+  VPN_SERVER=$(grep '^remote ' "$OVPN_CONFIG_FILE" | head -1 | awk '{print $2}')
+  VPN_PORT=$(grep '^remote ' "$OVPN_CONFIG_FILE" | head -1 | awk '{print $3}')
+  VPN_PROTO=$(grep '^proto ' "$OVPN_CONFIG_FILE" | head -1 | awk '{print $2}' | sed 's/[0-9]//g') # Remove trailing numbers from proto (e.g., udp4 -> udp)
+  [ -z "$VPN_PROTO" ] && VPN_PROTO="udp" # Default to UDP if not specified
+elif [ "${VPN_CLIENT,,}" = "wireguard" ] && [ -f "$WG_CONFIG" ]; then
+  # Extract endpoint from WireGuard config
+  WG_ENDPOINT=$(grep '^Endpoint' "$WG_CONFIG" | head -1 | awk -F'=' '{print $2}' | tr -d ' ')
+  if [ -n "$WG_ENDPOINT" ]; then
+    VPN_SERVER=$(echo "$WG_ENDPOINT" | cut -d: -f1)
+    VPN_PORT=$(echo "$WG_ENDPOINT" | cut -d: -f2)
+  fi
+fi
+
+finish_setup() {
+  # Create a flag file indicating VPN script completed successfully
+  # This is mostly for the healthcheck or external monitoring.
+  touch /tmp/vpn_setup_complete
+  echo "[INFO] FIXED VPN setup script finished. Container should now be routing traffic through VPN (if connection was successful)."
+  echo "[INFO] Final VPN interface: $(cat $VPN_INTERFACE_FILE)"
+  echo "[INFO] Transmission UI should be accessible on host port 9091."
+  if [ "${ENABLE_PRIVOXY,,}" = "yes" ] || [ "${ENABLE_PRIVOXY,,}" = "true" ]; then
+    echo "[INFO] Privoxy should be accessible on host port ${PRIVOXY_PORT:-8118}."
+  fi
+  date
+  echo "[INFO] --- End of FIXED vpn-setup.sh ---"
+}
+
+# --- nftables kill switch ---
+# The whole kill switch (LAN services, peer port, endpoint, CONNMARK marks) is one
+# nft ruleset loaded by vpn-killswitch.sh; the iptables rules below are skipped.
+if [ "${KILLSWITCH_BACKEND,,}" = "nftables" ] && command -v nft >/dev/null 2>&1; then
+  echo "[INFO] KILLSWITCH_BACKEND=nftables: loading the kill switch as one nftables ruleset..."
+  if [ -n "$LAN_NETWORK" ]; then
+    ETH0_GATEWAY=$(ip route | grep default | grep eth0 | awk '{print $3}')
+    [ -n "$ETH0_GATEWAY" ] && ip route add "$LAN_NETWORK" via "$ETH0_GATEWAY" dev eth0 2>/dev/null || true
+  fi
+  /usr/local/bin/vpn-killswitch.sh apply "$VPN_SERVER" "$VPN_PORT" "$VPN_PROTO"
+
+  # Only now open iptables, so the ruleset is never filtered twice and there is no unprotected window
+  iptables -F
+  iptables -t nat -F
+  iptables -t mangle -F
+  iptables -P INPUT ACCEPT
+  iptables -P FORWARD ACCEPT
+  iptables -P OUTPUT ACCEPT
+  echo "[INFO] Flushed iptables rules; nftables table inet killswitch is the kill switch."
+  finish_setup
+  exit 0
+fi
+
 # --- IPTables and Routing ---
 echo "[INFO] Configuring iptables and routing rules..."
 
@@ -590,33 +645,12 @@ fi
 iptables -A OUTPUT -o "$VPN_INTERFACE" -j ACCEPT
 
 # KILL SWITCH FIX: Allow OpenVPN/WireGuard traffic to VPN server before applying kill switch
-if [ "${VPN_CLIENT,,}" = "openvpn" ] && [ -f "$OVPN_CONFIG_FILE" ]; then
-  VPN_SERVER=$(grep '^remote ' "$OVPN_CONFIG_FILE" | head -1 | awk '{print $2}')
-  VPN_PORT=$(grep '^remote ' "$OVPN_CONFIG_FILE" | head -1 | awk '{print $3}')
-  VPN_PROTO=$(grep '^proto ' "$OVPN_CONFIG_FILE" | head -1 | awk '{print $2}' | sed 's/[0-9]//g') # Remove trailing numbers from proto (e.g., udp4 -> udp)
-  [ -z "$VPN_PROTO" ] && VPN_PROTO="udp" # Default to UDP if not specified
-
-  if [ -n "$VPN_SERVER" ] && [ -n "$VPN_PORT" ]; then
-    echo "[INFO] Adding kill switch exception for OpenVPN server $VPN_SERVER:$VPN_PORT ($VPN_PROTO)"
-    iptables -A OUTPUT -o eth0 -d "$VPN_SERVER" -p "$VPN_PROTO" --dport "$VPN_PORT" -j ACCEPT
-    # Allow DNS resolution for VPN server hostname (temporary, specific)
-    iptables -I OUTPUT 1 -p udp --dport 53 -o eth0 -m comment --comment "temp-vpn-dns" -j ACCEPT
-    iptables -I OUTPUT 1 -p tcp --dport 53 -o eth0 -m comment --comment "temp-vpn-dns" -j ACCEPT
-  fi
-elif [ "${VPN_CLIENT,,}" = "wireguard" ] && [ -f "$WG_CONFIG" ]; then
-  # Extract endpoint from WireGuard config
-  WG_ENDPOINT=$(grep '^Endpoint' "$WG_CONFIG" | head -1 | awk -F'=' '{print $2}' | tr -d ' ')
-  if [ -n "$WG_ENDPOINT" ]; then
-    WG_SERVER=$(echo "$WG_ENDPOINT" | cut -d: -f1)
-    WG_PORT=$(echo "$WG_ENDPOINT" | cut -d: -f2)
-    if [ -n "$WG_SERVER" ] && [ -n "$WG_PORT" ]; then
-      echo "[INFO] Adding kill switch exception for WireGuard server $WG_SERVER:$WG_PORT"
-      iptables -A OUTPUT -o eth0 -d "$WG_SERVER" -p udp --dport "$WG_PORT" -j ACCEPT
-      # Allow DNS resolution for VPN server hostname (temporary, specific)
-      iptables -I OUTPUT 1 -p udp --dport 53 -o eth0 -m comment --comment "temp-vpn-dns" -j ACCEPT
-      iptables -I OUTPUT 1 -p tcp --dport 53 -o eth0 -m comment --comment "temp-vpn-dns" -j ACCEPT
-    fi
-  fi
+if [ -n "$VPN_SERVER" ] && [ -n "$VPN_PORT" ]; then
+  echo "[INFO] Adding kill switch exception for ${VPN_CLIENT} server $VPN_SERVER:$VPN_PORT ($VPN_PROTO)"
+  iptables -A OUTPUT -o eth0 -d "$VPN_SERVER" -p "$VPN_PROTO" --dport "$VPN_PORT" -j ACCEPT
+  # Allow DNS resolution for VPN server hostname (temporary, specific)
+  iptables -I OUTPUT 1 -p udp --dport 53 -o eth0 -m comment --comment "temp-vpn-dns" -j ACCEPT
+  iptables -I OUTPUT 1 -p tcp --dport 53 -o eth0 -m comment --comment "temp-vpn-dns" -j ACCEPT
 fi
 
 # Remove temporary DNS rules after VPN connection is established
@@ -646,16 +680,4 @@ else
   echo "[INFO] Privoxy is disabled."
 fi
 
-# Create a flag file indicating VPN script completed successfully
-# This is mostly for the healthcheck or external monitoring.
-touch /tmp/vpn_setup_complete
-echo "[INFO] FIXED VPN setup script finished. Container should now be routing traffic through VPN (if connection was successful)."
-echo "[INFO] Final VPN interface: $(cat $VPN_INTERFACE_FILE)"
-echo "[INFO] Transmission UI should be accessible on host port 9091."
-if [ "${ENABLE_PRIVOXY,,}" = "yes" ] || [ "${ENABLE_PRIVOXY,,}" = "true" ]; then
-  echo "[INFO] Privoxy should be accessible on host port ${PRIVOXY_PORT:-8118}."
-fi
-date
-echo "[INFO] --- End of FIXED vpn-setup.sh ---"
-
-exit 0 
\ No newline at end of file
+finish_setup
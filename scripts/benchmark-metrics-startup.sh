@@ -0,0 +1,129 @@
+#!/bin/bash
+
+# TransmissionVPN Metrics Server Startup Benchmark
+# Measures module import time and time-to-first-scrape of the metrics server.
+# Runs against a local checkout; Transmission does not need to be running
+# (the server answers with a warming status until the RPC is reachable).
+#
+# Usage: ./scripts/benchmark-metrics-startup.sh [runs] [port]
+
+set -e
+
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+SERVER_SCRIPT="${SERVER_SCRIPT:-$SCRIPT_DIR/transmission-metrics-server.py}"
+PYTHON="${PYTHON:-python3}"
+RUNS="${1:-5}"
+PORT="${2:-19099}"
+GREEN='\033[0;32m'
+RED='\033[0;31m'
+YELLOW='\033[1;33m'
+NC='\033[0m' # No Color
+
+echo "⏱️  Metrics Server Startup Benchmark"
+echo "==================================="
+
+# Function to print status
+print_status() {
+    local status=$1
+    local message=$2
+    if [ "$status" = "PASS" ]; then
+        echo -e "${GREEN}✅ PASS${NC}: $message"
+    elif [ "$status" = "FAIL" ]; then
+        echo -e "${RED}❌ FAIL${NC}: $message"
+    else
+        echo -e "${YELLOW}ℹ️  INFO${NC}: $message"
+    fi
+}
+
+# Median of the numbers given on stdin (one per line)
+median() {
+    sort -n | awk '{ v[NR] = $1 } END { if (NR % 2) print v[(NR + 1) / 2]; else print (v[NR / 2] + v[NR / 2 + 1]) / 2 }'
+}
+
+now_ms() {
+    date +%s%3N
+}
+
+if [ ! -f "$SERVER_SCRIPT" ]; then
+    print_status "FAIL" "Server script not found: $SERVER_SCRIPT"
+    exit 1
+fi
+
+# Keep the benchmark self-contained: no state file, no pushes, RPC on a closed port
+export STATE_PERSIST_ENABLED=false
+export STORAGE_METRICS_ENABLED=false
+export PUSH_URL=""
+export TRANSMISSION_HOST="${TRANSMISSION_HOST:-127.0.0.1}"
+export TRANSMISSION_PORT="${TRANSMISSION_PORT:-1}"
+
+echo ""
+echo "1. Import Time ($RUNS runs)"
+echo "------------------------"
+
+IMPORT_TIMES=""
+for _ in $(seq "$RUNS"); do
+    RESULT=$("$PYTHON" - "$SERVER_SCRIPT" <<'EOF'
+import os, sys, time, importlib.util
+# transmission_rpc.py is imported from next to the script, as when it runs directly
+sys.path.insert(0, os.path.dirname(os.path.abspath(sys.argv[1])))
+started = time.perf_counter()
+spec = importlib.util.spec_from_file_location('metrics_server', sys.argv[1])
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+elapsed = (time.perf_counter() - started) * 1000
+eager = [name for name in ('requests', 'psutil') if name in sys.modules]
+print(f"{elapsed:.1f} {','.join(eager) or '-'}")
+EOF
+)
+    IMPORT_TIMES="$IMPORT_TIMES${RESULT%% *}"$'\n'
+    EAGER="${RESULT#* }"
+done
+
+print_status "INFO" "Median module load: $(echo -n "$IMPORT_TIMES" | median) ms"
+if [ "$EAGER" = "-" ]; then
+    print_status "PASS" "requests and psutil are not imported at module load"
+else
+    print_status "FAIL" "Imported eagerly at module load: $EAGER"
+fi
+
+if "$PYTHON" -X importtime -c "import requests, psutil" 2>/tmp/metrics-importtime.log; then
+    DEFERRED=$(awk -F'|' '/import time:/ && $3 ~ /^ (requests|psutil)$/ { sum += $2 } END { printf "%.1f", sum / 1000 }' /tmp/metrics-importtime.log)
+    print_status "INFO" "Deferred until first use (requests + psutil): ${DEFERRED} ms"
+fi
+rm -f /tmp/metrics-importtime.log
+
+echo ""
+echo "2. Time to First Scrape ($RUNS runs, port $PORT)"
+echo "------------------------"
+
+SCRAPE_TIMES=""
+for _ in $(seq "$RUNS"); do
+    STARTED=$(now_ms)
+    METRICS_PORT="$PORT" "$PYTHON" "$SERVER_SCRIPT" >/dev/null 2>&1 &
+    SERVER_PID=$!
+    FIRST=""
+    for _ in $(seq 1000); do
+        if curl -sf "http://127.0.0.1:$PORT/metrics" -o /tmp/metrics-first-scrape.txt 2>/dev/null; then
+            FIRST=$(now_ms)
+            break
+        fi
+        sleep 0.01
+    done
+    kill "$SERVER_PID" 2>/dev/null || true
+    wait "$SERVER_PID" 2>/dev/null || true
+
+    if [ -z "$FIRST" ]; then
+        print_status "FAIL" "No successful scrape within 10s"
+        rm -f /tmp/metrics-first-scrape.txt
+        exit 1
+    fi
+    SCRAPE_TIMES="$SCRAPE_TIMES$((FIRST - STARTED))"$'\n'
+done
+
+print_status "INFO" "Median time to first scrape: $(echo -n "$SCRAPE_TIMES" | median) ms"
+if grep -q '^transmission_exporter_warming 1' /tmp/metrics-first-scrape.txt; then
+    print_status "PASS" "First scrape answered with warming status while Transmission was unreachable"
+else
+    print_status "FAIL" "First scrape did not report transmission_exporter_warming 1"
+fi
+rm -f /tmp/metrics-first-scrape.txt
@@ -0,0 +1,136 @@
+#!/bin/bash
+
+# nftables Kill Switch Test Script
+# Loads the nftables kill switch backend inside an unprivileged user + network
+# namespace (no root, no container, host firewall untouched) and checks the
+# ruleset, set-element updates and transactional reloads.
+#
+# Requires: nft, unshare (util-linux), iproute2
+# Usage: ./scripts/test-nft-killswitch.sh
+
+set -e
+
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+KILLSWITCH="${KILLSWITCH:-$SCRIPT_DIR/../root/vpn-killswitch.sh}"
+GREEN='\033[0;32m'
+RED='\033[0;31m'
+YELLOW='\033[1;33m'
+NC='\033[0m' # No Color
+
+# Function to print status
+print_status() {
+    local status=$1
+    local message=$2
+    if [ "$status" = "PASS" ]; then
+        echo -e "${GREEN}✅ PASS${NC}: $message"
+    elif [ "$status" = "FAIL" ]; then
+        echo -e "${RED}❌ FAIL${NC}: $message"
+        FAILED=true
+    else
+        echo -e "${YELLOW}ℹ️  INFO${NC}: $message"
+    fi
+}
+
+check() {
+    local message=$1
+    shift
+    if "$@" >/dev/null 2>&1; then
+        print_status "PASS" "$message"
+    else
+        print_status "FAIL" "$message"
+    fi
+}
+
+# Re-run inside a fresh user + network namespace where we are root
+if [ "$1" != "--in-namespace" ]; then
+    for tool in nft unshare ip; do
+        if ! command -v "$tool" >/dev/null 2>&1; then
+            print_status "FAIL" "$tool is not installed"
+            exit 1
+        fi
+    done
+    exec unshare --user --map-root-user --net "$0" --in-namespace
+fi
+
+echo "🧱 nftables Kill Switch Test (unprivileged namespace)"
+echo "===================================================="
+
+WORKDIR=$(mktemp -d)
+trap 'rm -rf "$WORKDIR"' EXIT
+
+export KILLSWITCH_BACKEND=nftables
+export NFT_RULESET_FILE="$WORKDIR/killswitch.nft"
+export KILLSWITCH_ALLOWLIST_FILE="$WORKDIR/allowlist"
+export LAN_NETWORK="192.168.1.0/24"
+export METRICS_ENABLED=true
+export METRICS_PORT=9099
+export TRANSMISSION_PEER_PORT=51413
+
+run_killswitch() {
+    bash "$KILLSWITCH" "$@"
+}
+
+# Stand-in interfaces for the container's eth0 and the VPN tunnel (a veth pair
+# needs no extra kernel modules)
+ip link set lo up
+ip link add eth0 type veth peer name tun0
+ip link set eth0 up
+ip link set tun0 up
+
+echo ""
+echo "1. Apply Ruleset"
+echo "------------------------"
+check "Ruleset loads in one nft transaction" run_killswitch apply 198.51.100.7 1194 udp
+check "Verify reports the kill switch as active" run_killswitch verify
+for chain in input output forward; do
+    check "Chain $chain has policy drop" sh -c "nft list chain inet killswitch $chain | grep -q 'policy drop'"
+done
+check "VPN endpoint is in vpn_endpoints set" sh -c "nft list set inet killswitch vpn_endpoints | grep -q '198.51.100.7 . udp . 1194'"
+check "LAN network is in lan_networks set" sh -c "nft list set inet killswitch lan_networks | grep -q '192.168.1.0/24'"
+check "Metrics port is in lan_service_ports set" sh -c "nft list set inet killswitch lan_service_ports | grep -q '9099'"
+check "tun0 is in vpn_interfaces set" sh -c "nft list set inet killswitch vpn_interfaces | grep -q '\"tun0\"'"
+
+echo ""
+echo "2. Set Element Updates"
+echo "------------------------"
+HANDLES_BEFORE=$(nft -a list chain inet killswitch output | grep -o 'handle [0-9]*' | tr '\n' ' ')
+check "Forwarded port added as set element" run_killswitch allow-peer-port 41234
+check "Forwarded port present in peer_ports" sh -c "nft list set inet killswitch peer_ports | grep -q '41234'"
+check "New VPN endpoint added as set element" run_killswitch allow-endpoint 203.0.113.9 51820 udp
+check "Old VPN endpoint revoked" run_killswitch revoke-endpoint 198.51.100.7 1194 udp
+check "Unresolvable VPN endpoint is rejected" sh -c "! bash '$KILLSWITCH' allow-endpoint vpn.invalid 1194 udp"
+check "Unresolvable VPN endpoint is reported" sh -c "bash '$KILLSWITCH' render vpn.invalid 1194 udp 2>&1 >/dev/null | grep -q 'Could not resolve vpn.invalid'"
+check "Old VPN endpoint no longer allowed" sh -c "! nft list set inet killswitch vpn_endpoints | grep -q '198.51.100.7'"
+HANDLES_AFTER=$(nft -a list chain inet killswitch output | grep -o 'handle [0-9]*' | tr '\n' ' ')
+if [ "$HANDLES_BEFORE" = "$HANDLES_AFTER" ]; then
+    print_status "PASS" "Rules untouched by set updates (same rule handles)"
+else
+    print_status "FAIL" "Rules changed during set updates"
+fi
+
+echo ""
+echo "3. Transactional Reload"
+echo "------------------------"
+cp "$NFT_RULESET_FILE" "$WORKDIR/broken.nft"
+echo "this is not valid nft syntax" >> "$WORKDIR/broken.nft"
+if nft -f "$WORKDIR/broken.nft" >/dev/null 2>&1; then
+    print_status "FAIL" "Broken ruleset was accepted"
+else
+    print_status "PASS" "Broken ruleset rejected"
+fi
+check "Previous ruleset still loaded after failed reload" sh -c "nft list set inet killswitch peer_ports | grep -q '41234'"
+
+check "Emergency ruleset replaces the table" run_killswitch emergency
+check "Verify fails while only the emergency ruleset is loaded" sh -c "! bash '$KILLSWITCH' verify"
+check "Re-apply restores the full ruleset" run_killswitch apply 203.0.113.9 51820 udp
+check "Verify passes after re-apply" run_killswitch verify
+check "Forwarded port survives the re-apply" sh -c "nft list set inet killswitch peer_ports | grep -q '41234'"
+check "Runtime VPN endpoint survives the re-apply" sh -c "nft list set inet killswitch vpn_endpoints | grep -q '203.0.113.9 . udp . 51820'"
+check "Revoked VPN endpoint stays revoked" sh -c "! nft list set inet killswitch vpn_endpoints | grep -q '198.51.100.7'"
+
+echo ""
+if [ "$FAILED" = "true" ]; then
+    print_status "FAIL" "nftables kill switch test failed"
+    exit 1
+fi
+print_status "PASS" "All nftables kill switch checks passed"
@@ -0,0 +1,111 @@
+"""
+Transmission RPC client
+Shared by the metrics server and the PIA port forwarding agent, so both speak
+RPC the same way (session id handshake, auth, timeouts and deadlines)
+"""
+
+import os
+import time
+import logging
+
+# Configuration from environment variables
+TRANSMISSION_HOST = os.getenv('TRANSMISSION_HOST', '127.0.0.1')
+TRANSMISSION_PORT = os.getenv('TRANSMISSION_PORT', '9091')
+TRANSMISSION_USERNAME = os.getenv('TRANSMISSION_RPC_USERNAME', '')
+TRANSMISSION_PASSWORD = os.getenv('TRANSMISSION_RPC_PASSWORD', '')
+TRANSMISSION_URL = f"http://{TRANSMISSION_HOST}:{TRANSMISSION_PORT}/transmission/rpc"
+TRANSMISSION_RPC_TIMEOUT = float(os.getenv('TRANSMISSION_RPC_TIMEOUT', '30'))
+
+# Records go through the calling script's logging configuration
+logger = logging.getLogger(__name__)
+
+class TransmissionAPI:
+    def __init__(self, url=None, username=None, password=None, session=None, timeout=TRANSMISSION_RPC_TIMEOUT):
+        if session is None:
+            # Imported on first use so importing this module stays cheap
+            import requests
+            session = requests.Session()
+        self.url = url or TRANSMISSION_URL
+        self.session_id = None
+        self.session = session
+        self.timeout = timeout
+        self.deadline = None  # time.monotonic() cutoff shared by every request until cleared
+        self.auth = None
+        username = TRANSMISSION_USERNAME if username is None else username
+        password = TRANSMISSION_PASSWORD if password is None else password
+        if username and password:
+            self.auth = (username, password)
+    
+    def _timeout(self):
+        """Request timeout, clipped to what is left before the deadline"""
+        if self.deadline is None:
+            return self.timeout
+        remaining = self.deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError("collection deadline exceeded")
+        if isinstance(self.timeout, tuple):
+            return tuple(min(t, remaining) for t in self.timeout)
+        return min(self.timeout, remaining) if self.timeout else remaining
+    
+    def _get_session_id(self):
+        """Get session ID from Transmission"""
+        try:
+            response = self.session.post(self.url, json={"method": "session-get"},
+                                         auth=self.auth, timeout=self._timeout())
+            if response.status_code == 409:
+                self.session_id = response.headers.get('X-Transmission-Session-Id')
+                logger.info(f"Got session ID: {self.session_id}")
+                return True
+            return False
+        except Exception as e:
+            logger.error(f"Failed to get session ID: {e}")
+            return False
+    
+    def _make_request(self, method, arguments=None):
+        """Make RPC request to Transmission"""
+        if not self.session_id:
+            if not self._get_session_id():
+                return None
+        
+        headers = {'X-Transmission-Session-Id': self.session_id}
+        data = {"method": method}
+        if arguments:
+            data["arguments"] = arguments
+        
+        try:
+            response = self.session.post(self.url, json=data, headers=headers,
+                                         auth=self.auth, timeout=self._timeout())
+            if response.status_code == 409:
+                # Session ID expired, get new one
+                if self._get_session_id():
+                    headers['X-Transmission-Session-Id'] = self.session_id
+                    response = self.session.post(self.url, json=data, headers=headers,
+                                                 auth=self.auth, timeout=self._timeout())
+            
+            if response.status_code == 200:
+                return response.json()
+            else:
+                logger.error(f"Request failed: {response.status_code} - {response.text}")
+                return None
+        except Exception as e:
+            logger.error(f"Request error: {e}")
+            return None
+    
+    def get_session_stats(self):
+        """Get session statistics"""
+        return self._make_request("session-stats")
+    
+    def get_session(self):
+        """Get session settings"""
+        return self._make_request("session-get")
+    
+    def set_session(self, arguments):
+        """Change session settings"""
+        return self._make_request("session-set", arguments)
+    
+    def get_torrents(self, fields, ids=None):
+        """Get torrent list with the given fields"""
+        arguments = {"fields": fields}
+        if ids is not None:
+            arguments["ids"] = ids
+        return self._make_request("torrent-get", arguments)
@@ -0,0 +1,66 @@
+"""Shared helpers for the tests"""
+
+import importlib.util
+import os
+import sys
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# transmission_rpc.py sits next to the scripts, as in /usr/local/bin
+sys.path.insert(0, os.path.join(REPO_ROOT, 'scripts'))
+
+_modules = {}
+
+def load_script(name, relative_path):
+    """Import a script that is not a package module (hyphenated file names), once per test run"""
+    if name not in _modules:
+        spec = importlib.util.spec_from_file_location(name, os.path.join(REPO_ROOT, relative_path))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+        _modules[name] = module
+    return _modules[name]
+
+def load_metrics_server():
+    return load_script('transmission_metrics_server', 'scripts/transmission-metrics-server.py')
+
+def load_port_forward_agent():
+    return load_script('pia_port_forward', 'root/pia-port-forward.py')
+
+class HTTPSink:
+    """Local HTTP server recording requests; answers with `status` or a custom handler"""
+
+    def __init__(self, handler=None):
+        self.requests = []
+        self.status = 204
+        self.handler = handler
+        sink = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.do_POST()
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                sink.requests.append((self.path, dict(self.headers), body))
+                status, headers, reply = sink.handler(self, body) if sink.handler else (sink.status, {}, b'')
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header('Content-Length', str(len(reply)))
+                self.end_headers()
+                self.wfile.write(reply)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
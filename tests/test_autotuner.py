@@ -0,0 +1,70 @@
+"""BandwidthAutotuner proposals, bounds and hysteresis"""
+
+import unittest
+
+from support import load_metrics_server
+
+ms = load_metrics_server()
+
+class BandwidthAutotunerTest(unittest.TestCase):
+    def autotuner(self, **kwargs):
+        autotuner = ms.BandwidthAutotuner(dry_run=True, **kwargs)
+        autotuner.bounds['download-queue-size'] = (2, 6)
+        autotuner.bounds['peer-limit-global'] = (50, 400)
+        return autotuner
+
+    def test_proposals_are_clamped_to_bounds(self):
+        autotuner = self.autotuner()
+        proposals = {}
+        autotuner._propose(proposals, 'download-queue-size', 4, 50, 'grow')
+        autotuner._propose(proposals, 'peer-limit-global', 200, 1, 'shrink')
+        self.assertEqual(proposals, {'download-queue-size': (6, 'grow'), 'peer-limit-global': (50, 'shrink')})
+
+    def test_no_proposal_once_at_a_bound(self):
+        autotuner = self.autotuner()
+        proposals = {}
+        autotuner._propose(proposals, 'download-queue-size', 6, 7, 'grow')
+        self.assertEqual(proposals, {})
+
+    def test_waiting_torrents_and_idle_bandwidth_grow_the_queue(self):
+        autotuner = self.autotuner()
+        autotuner.decide([], {}, (1000000, 0))  # Establishes capacity
+        torrents = [{'status': 4, 'rateDownload': 0}, {'status': 3}]
+        proposals = autotuner.decide(torrents, {'download-queue-size': 1}, (1000, 0))
+        self.assertEqual(proposals['download-queue-size'][0], 2)
+
+    def test_peer_limit_deadband(self):
+        autotuner = self.autotuner()
+        torrents = [{'status': 6, 'rateUpload': 100000}] * 4
+        target = ms.AUTOTUNE_PEERS_PER_TORRENT * 4
+        near = autotuner.decide(torrents, {'peer-limit-global': int(target * 1.1)}, (0, 0))
+        self.assertNotIn('peer-limit-global', near)
+        far = autotuner.decide(torrents, {'peer-limit-global': target * 2}, (0, 0))
+        self.assertEqual(far['peer-limit-global'][0], max(50, min(400, target)))
+
+    def test_settle_holds_and_cools_down(self):
+        autotuner = self.autotuner(hold_cycles=2, cooldown=100)
+        settings = {'download-queue-size': 3}
+        proposal = {'download-queue-size': (4, 'grow')}
+        self.assertEqual(autotuner._settle(proposal, settings, 1000), {})
+        self.assertEqual(autotuner._settle(proposal, settings, 1010), {'download-queue-size': (4, 'up', 'grow')})
+
+        # A change in direction restarts the hold
+        self.assertEqual(autotuner._settle({'download-queue-size': (2, 'shrink')}, settings, 1020), {})
+        autotuner.pending.clear()
+
+        autotuner.last_change['download-queue-size'] = 1010
+        autotuner._settle(proposal, settings, 1050)
+        self.assertEqual(autotuner._settle(proposal, settings, 1060), {})
+        self.assertIn('download-queue-size', autotuner._settle(proposal, settings, 1110))
+
+    def test_dropped_proposal_resets_the_hold(self):
+        autotuner = self.autotuner(hold_cycles=2, cooldown=0)
+        settings = {'download-queue-size': 3}
+        proposal = {'download-queue-size': (4, 'grow')}
+        autotuner._settle(proposal, settings, 1000)
+        autotuner._settle({}, settings, 1010)
+        self.assertEqual(autotuner._settle(proposal, settings, 1020), {})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+"""Health rule conditions and the inactive/pending/firing state machine"""
+
+import unittest
+
+from support import load_metrics_server
+
+ms = load_metrics_server()
+
+class HealthRuleTest(unittest.TestCase):
+    snapshot = {'vpn': {'connected': True, 'latency': 0.4}, 'torrents': {'stalled': 3}, 'zero': 0}
+
+    def test_conditions(self):
+        compile = ms.compile_condition
+        self.assertTrue(compile({'path': 'vpn.latency', 'op': '>', 'value': 0.25})(self.snapshot))
+        self.assertFalse(compile({'path': 'vpn.missing', 'op': '>', 'value': 0})(self.snapshot))
+        self.assertFalse(compile({'path': 'vpn.latency.deeper'})(self.snapshot))
+        self.assertTrue(compile({'all': [{'path': 'vpn.connected'},
+                                         {'not': {'path': 'torrents.stalled', 'op': '<', 'value': 1}}]})(self.snapshot))
+        self.assertTrue(compile({'any': [{'path': 'vpn.connected', 'value': False},
+                                         {'path': 'torrents.stalled', 'op': 'in', 'value': [1, 3]}]})(self.snapshot))
+
+    def test_booleans_only_match_booleans(self):
+        self.assertFalse(ms.compile_condition({'path': 'zero', 'value': False})(self.snapshot))
+
+    def test_uncomparable_values_never_match(self):
+        self.assertFalse(ms.compile_condition({'path': 'vpn', 'op': '>', 'value': 1})(self.snapshot))
+
+    def test_unknown_operator_is_rejected(self):
+        with self.assertRaises(ValueError):
+            ms.compile_condition({'path': 'zero', 'op': '=~'})
+        with self.assertRaises(ValueError):
+            ms.HealthRule({'name': 'bad', 'when': {'path': 'zero', 'op': '=~'}})
+
+    def test_pending_firing_and_clear_hysteresis(self):
+        engine = ms.HealthRuleEngine([{
+            'name': 'slow_vpn', 'severity': 'warning', 'for': 30, 'clear_for': 60,
+            'when': {'path': 'latency', 'op': '>', 'value': 0.5},
+            'clear': {'path': 'latency', 'op': '<', 'value': 0.3}
+        }])
+        def at(now, latency):
+            return engine.evaluate({'latency': latency}, now)
+
+        self.assertEqual(at(0, 0.8), ({'critical': [], 'warning': [], 'notice': []}, ['slow_vpn']))
+        self.assertEqual(at(10, 0.2)[1], [])  # Dropped before `for` elapsed
+        at(20, 0.8)
+        self.assertEqual(at(50, 0.8)[0]['warning'], ['slow_vpn'])
+
+        # Between the thresholds the rule stays firing; clearing needs clear_for below 0.3
+        self.assertEqual(at(100, 0.4)[0]['warning'], ['slow_vpn'])
+        at(110, 0.2)
+        self.assertEqual(at(150, 0.2)[0]['warning'], ['slow_vpn'])
+        at(160, 0.4)
+        self.assertEqual(at(200, 0.2)[0]['warning'], ['slow_vpn'])
+        self.assertEqual(at(260, 0.2)[0]['warning'], [])
+        self.assertEqual(engine.rules[0].transitions, {'pending': 2, 'inactive': 2, 'firing': 1})
+
+    def test_missing_clear_path_falls_back_to_the_condition(self):
+        rule = ms.HealthRule({
+            'name': 'disk_space_low', 'when': {'path': 'disk.usage', 'op': '>', 'value': 90},
+            'clear': {'all': [{'path': 'disk.usage', 'op': '<', 'value': 85}, {'path': 'disk.mounted'}]}
+        })
+        rule.evaluate({'disk': {'usage': 95, 'mounted': True}}, 0)
+        self.assertEqual(rule.state, 'firing')
+        rule.evaluate({'disk': {'usage': 88, 'mounted': True}}, 10)
+        self.assertEqual(rule.state, 'firing')  # Between the thresholds
+        rule.evaluate({}, 20)  # The disk section is gone
+        self.assertEqual(rule.state, 'inactive')
+
+    def test_default_rules_see_instance_pool_health(self):
+        pool = ms.InstancePool([{'name': 'a', 'url': 'http://127.0.0.1:1/transmission/rpc'}])
+        self.addCleanup(pool.executor.shutdown)
+        self.addCleanup(pool.session.close)
+        engine = ms.HealthRuleEngine(ms.DEFAULT_HEALTH_RULES)
+        snapshot = {'transmission': pool.health()}
+        engine.evaluate(snapshot, 0)
+        firing, _ = engine.evaluate(snapshot, 60)
+        self.assertEqual(firing['critical'], ['transmission_daemon_down', 'web_ui_inaccessible', 'rpc_inaccessible'])
+
+    def test_duplicate_rule_names_are_rejected(self):
+        rule = {'name': 'dup', 'when': {'path': 'zero'}}
+        with self.assertRaises(ValueError):
+            ms.HealthRuleEngine([rule, rule])
+
+if __name__ == '__main__':
+    unittest.main()
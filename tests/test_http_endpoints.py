@@ -0,0 +1,211 @@
+"""MetricsHandler endpoints served from a local ThreadingHTTPServer"""
+
+import http.client
+import json
+import threading
+import time
+import tracemalloc
+import unittest
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+from support import load_metrics_server
+
+ms = load_metrics_server()
+
+class EndpointTest(unittest.TestCase):
+    server_class = ThreadingHTTPServer
+
+    def setUp(self):
+        server = self.server_class(('127.0.0.1', 0), ms.MetricsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.port = server.server_port
+        self.url = f"http://127.0.0.1:{self.port}"
+
+    def patch(self, **values):
+        for name, value in values.items():
+            self.addCleanup(setattr, ms, name, getattr(ms, name))
+            setattr(ms, name, value)
+
+    def get(self, path):
+        try:
+            with urllib.request.urlopen(self.url + path, timeout=5) as response:
+                return response.status, response.read().decode('utf-8')
+        except urllib.error.HTTPError as e:
+            return e.code, e.read().decode('utf-8')
+
+class HealthEndpointTest(EndpointTest):
+    def health(self):
+        status, body = self.get('/health')
+        self.assertEqual(status, 200)
+        return json.loads(body)
+
+    def test_warming_until_the_first_collection(self):
+        self.patch(warming=True, health_data={'status': 'healthy'})
+        self.assertEqual(self.health()['status'], 'warming')
+
+    def test_empty_or_statusless_data_is_never_served(self):
+        self.patch(warming=False, health_data={}, transmission_stats=ms.transmission_stats,
+                   session_stats=ms.session_stats, last_update=ms.last_update)
+        self.assertEqual(self.health()['status'], 'warming')
+        # What load_core_state restores from a state file saved before the first health update
+        ms.load_core_state({})
+        self.assertEqual(self.health()['status'], 'warming')
+
+    def test_collected_data_is_served(self):
+        self.patch(warming=False, health_data={'status': 'degraded', 'issues': ['vpn_down']})
+        self.assertEqual(self.health(), {'status': 'degraded', 'issues': ['vpn_down']})
+
+class SummaryEndpointTest(EndpointTest):
+    def setUp(self):
+        super().setUp()
+        self.snapshot = ms.SummarySnapshot()
+        self.snapshot.update({'status': 'healthy', 'torrents': 3, 'download_rate': 1024})
+        self.patch(summary_snapshot=self.snapshot)
+
+    def fetch(self, path, etag=None):
+        request = urllib.request.Request(self.url + path, headers={'If-None-Match': etag} if etag else {})
+        try:
+            with urllib.request.urlopen(request, timeout=5) as response:
+                return response.status, response.headers.get('ETag'), response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers.get('ETag'), e.read()
+
+    def test_fields_are_projected(self):
+        status, _, body = self.fetch('/api/summary?fields=torrents,missing&fields=status')
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body), {'status': 'healthy', 'torrents': 3})
+
+    def test_unchanged_snapshot_revalidates(self):
+        _, etag, body = self.fetch('/api/summary')
+        self.assertEqual(json.loads(body)['download_rate'], 1024)
+        self.assertEqual(self.fetch('/api/summary', etag)[:2], (304, etag))
+        # Each projection has its own tag
+        self.assertEqual(self.fetch('/api/summary?fields=status', etag)[0], 200)
+
+        self.snapshot.update({'status': 'healthy', 'torrents': 4, 'download_rate': 1024})
+        status, changed, body = self.fetch('/api/summary', etag)
+        self.assertEqual(status, 200)
+        self.assertNotEqual(changed, etag)
+        self.assertEqual(json.loads(body)['torrents'], 4)
+
+    def test_long_poll_returns_on_change(self):
+        _, etag, _ = self.fetch('/api/summary?fields=torrents')
+        timer = threading.Timer(0.2, self.snapshot.update, [{'status': 'healthy', 'torrents': 5}])
+        timer.start()
+        self.addCleanup(timer.cancel)
+        started = time.monotonic()
+        status, _, body = self.fetch('/api/summary?fields=torrents&wait=10', etag)
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual((status, json.loads(body)), (200, {'torrents': 5}))
+
+    def test_long_poll_times_out_unchanged(self):
+        _, etag, _ = self.fetch('/api/summary?fields=torrents')
+        # A change outside the projection does not wake the poll
+        threading.Timer(0.1, self.snapshot.update, [{'status': 'degraded', 'torrents': 3}]).start()
+        self.assertEqual(self.fetch('/api/summary?fields=torrents&wait=0.5', etag)[:2], (304, etag))
+
+    def test_unavailable_before_startup(self):
+        self.patch(summary_snapshot=None)
+        self.assertEqual(self.get('/api/summary')[0], 503)
+
+class EventsEndpointTest(EndpointTest):
+    # MetricsServer keeps the sockets handed to the hub open after the handler returns
+    server_class = ms.MetricsServer
+
+    def setUp(self):
+        super().setUp()
+        self.hub = ms.EventHub(max_clients=1)
+        threading.Thread(target=self.hub.run, daemon=True).start()
+        self.patch(event_hub=self.hub)
+
+    def subscribe(self):
+        connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=5)
+        self.addCleanup(connection.close)
+        connection.request('GET', '/events')
+        return connection.getresponse()
+
+    @staticmethod
+    def read_event(response):
+        lines = iter(response.fp.readline, b'\n')
+        return dict(line.decode('utf-8').rstrip('\n').split(': ', 1) for line in lines)
+
+    def wait_for_clients(self, count):
+        deadline = time.monotonic() + 5
+        while len(self.hub.clients) != count:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+
+    def test_reserved_slots_count_against_the_limit(self):
+        hub = ms.EventHub(max_clients=2)
+        self.assertTrue(hub.reserve())
+        self.assertTrue(hub.reserve())
+        self.assertFalse(hub.reserve())
+        hub.release()
+        self.assertTrue(hub.reserve())
+        self.assertEqual(hub.reserved, 2)
+
+    def test_subscriber_gets_snapshot_then_diffs(self):
+        self.hub.publish({'status': 'healthy', 'download_rate': 0})
+        response = self.subscribe()
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.getheader('Content-Type'), 'text/event-stream')
+        event = self.read_event(response)
+        self.assertEqual(event['event'], 'snapshot')
+        self.assertEqual(json.loads(event['data']), {'status': 'healthy', 'download_rate': 0})
+
+        self.wait_for_clients(1)
+        self.hub.publish({'status': 'healthy', 'download_rate': 2048})
+        event = self.read_event(response)
+        self.assertEqual((event['event'], json.loads(event['data'])), ('update', {'download_rate': 2048}))
+
+    def test_full_hub_refuses_with_retry_after(self):
+        first = self.subscribe()
+        self.assertEqual(first.status, 200)
+        refused = self.subscribe()
+        self.assertEqual(refused.status, 503)
+        self.assertEqual(refused.getheader('Retry-After'), str(ms.EventHub.HEARTBEAT))
+        self.assertEqual(self.hub.reserved, 0)
+
+        # Closing the subscriber frees its slot
+        self.wait_for_clients(1)
+        first.close()
+        self.wait_for_clients(0)
+        self.assertEqual(self.subscribe().status, 200)
+
+    def test_unavailable_before_startup(self):
+        self.patch(event_hub=None)
+        self.assertEqual(self.get('/events')[0], 503)
+
+class DebugEndpointTest(EndpointTest):
+    def setUp(self):
+        super().setUp()
+        self.patch(DEBUG_ENDPOINTS_ENABLED=True, tracemalloc_baseline=None)
+        self.addCleanup(tracemalloc.stop)
+
+    def test_tracemalloc_flags_without_values(self):
+        status, body = self.get('/debug/tracemalloc?start=')
+        self.assertEqual(status, 200, body)
+        self.assertTrue(tracemalloc.is_tracing())
+
+        status, body = self.get('/debug/tracemalloc?top=&key=')
+        self.assertEqual(status, 200, body)
+        self.assertIn('# Top allocations', body)
+
+        status, _ = self.get('/debug/tracemalloc?stop')
+        self.assertEqual(status, 200)
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_tracemalloc_start_with_frames(self):
+        self.assertEqual(self.get('/debug/tracemalloc?start=5')[0], 200)
+        self.assertEqual(tracemalloc.get_traceback_limit(), 5)
+
+    def test_bad_values_are_rejected(self):
+        self.get('/debug/tracemalloc?start=')
+        self.assertEqual(self.get('/debug/tracemalloc?key=bogus')[0], 400)
+
+if __name__ == '__main__':
+    unittest.main()
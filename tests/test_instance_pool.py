@@ -0,0 +1,80 @@
+"""Multi-instance collection: one deadline per instance refresh, bounded pool batches"""
+
+import json
+import time
+import unittest
+
+from support import HTTPSink, load_metrics_server
+from transmission_rpc import TransmissionAPI
+
+ms = load_metrics_server()
+
+class FakeDaemon:
+    """Transmission RPC answering every request after `delay` seconds"""
+
+    def __init__(self, delay=0):
+        self.delay = delay
+
+    def __call__(self, request, body):
+        time.sleep(self.delay)
+        if request.headers.get('X-Transmission-Session-Id') != 'sid':
+            return 409, {'X-Transmission-Session-Id': 'sid'}, b''
+        method = json.loads(body)['method']
+        arguments = {'torrents': []} if method == 'torrent-get' else {'downloadSpeed': 0}
+        return 200, {'Content-Type': 'application/json'}, json.dumps({'result': 'success', 'arguments': arguments}).encode()
+
+class DeadlineTest(unittest.TestCase):
+    def test_timeout_is_clipped_to_the_deadline(self):
+        api = TransmissionAPI(url='http://127.0.0.1:1/transmission/rpc', timeout=(5, 10))
+        self.addCleanup(api.session.close)
+        self.assertEqual(api._timeout(), (5, 10))
+        api.deadline = time.monotonic() + 2
+        connect, read = api._timeout()
+        self.assertLessEqual(connect, 2)
+        self.assertLessEqual(read, 2)
+        api.deadline = time.monotonic() - 1
+        with self.assertRaises(TimeoutError):
+            api._timeout()
+
+class InstancePoolTest(unittest.TestCase):
+    def setUp(self):
+        for name, value in {'INSTANCE_TIMEOUT': 0.5, 'METRICS_INTERVAL': 30}.items():
+            self.addCleanup(setattr, ms, name, getattr(ms, name))
+            setattr(ms, name, value)
+
+    def daemon(self, delay):
+        sink = HTTPSink(FakeDaemon(delay))
+        self.addCleanup(sink.close)
+        return {'name': f"instance-{sink.server.server_port}", 'url': f"{sink.url}/transmission/rpc"}
+
+    def pool(self, configs):
+        pool = ms.InstancePool(configs)
+        self.addCleanup(pool.executor.shutdown)
+        self.addCleanup(pool.session.close)
+        return pool
+
+    def test_one_deadline_covers_the_whole_refresh(self):
+        # Every request alone fits the timeout, the refresh as a whole does not
+        pool = self.pool([self.daemon(0.3)])
+        instance = next(iter(pool.instances.values()))
+        self.assertTrue(instance.collect())
+        self.assertFalse(instance.up)
+        self.assertLess(instance.duration, 0.8)
+        self.assertEqual(instance.failures, 1)
+        self.assertGreater(instance.backoff_until, time.time())
+        self.assertIsNone(instance.api.deadline)
+        self.assertFalse(instance.collect())  # Backing off
+
+    def test_slow_instance_does_not_hold_up_the_batch(self):
+        fast, slow = self.daemon(0), self.daemon(0.3)
+        pool = self.pool([fast, slow])
+        started = time.monotonic()
+        pool.collect_all()
+        self.assertLess(time.monotonic() - started, 1.0)
+        self.assertTrue(pool.instances[fast['name']].up)
+        self.assertFalse(pool.instances[slow['name']].up)
+        health = pool.health()
+        self.assertEqual((health['instances_up'], health['instances_total']), (1, 2))
+
+if __name__ == '__main__':
+    unittest.main()
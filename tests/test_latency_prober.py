@@ -0,0 +1,70 @@
+"""LatencyProber: probe rounds and target resolution on the resolver pool"""
+
+import socket
+import threading
+import time
+import unittest
+from unittest import mock
+
+from support import load_metrics_server
+
+ms = load_metrics_server()
+
+class LatencyProberTest(unittest.TestCase):
+    def setUp(self):
+        self.listener = socket.socket()
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen(8)
+        self.addCleanup(self.listener.close)
+        self.port = self.listener.getsockname()[1]
+
+    def prober(self, targets, timeout=0.3):
+        prober = ms.LatencyProber(targets, [], interval=1, timeout=timeout, window=10)
+        self.addCleanup(prober.resolver.shutdown, wait=False)
+        return prober
+
+    def test_round_measures_a_connect(self):
+        prober = self.prober([('localhost', self.port)])
+        prober.probe_round()
+        histogram = prober.histograms[('tcp', f"localhost:{self.port}")]
+        self.assertEqual((histogram.count, histogram.failures), (1, 0))
+        self.assertIn(('localhost', self.port), prober.resolved)
+
+    def test_unresolved_target_counts_as_a_failure(self):
+        prober = self.prober([('probe.invalid', 443)])
+        with self.assertRaises(OSError):
+            prober._start_tcp(None, 'probe.invalid', 443)
+        prober.probe_round()
+        histogram = prober.histograms[('tcp', 'probe.invalid:443')]
+        self.assertEqual((histogram.count, histogram.failures), (0, 1))
+
+    def test_hung_lookup_does_not_stall_rounds(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        real_getaddrinfo = socket.getaddrinfo
+        calls = []
+
+        def slow_getaddrinfo(host, *args, **kwargs):
+            calls.append(host)
+            if host == 'slow.example':
+                release.wait(5)
+                host = '127.0.0.1'
+            return real_getaddrinfo(host, *args, **kwargs)
+
+        prober = self.prober([('slow.example', self.port), ('127.0.0.1', self.port)])
+        with mock.patch.object(ms.socket, 'getaddrinfo', slow_getaddrinfo):
+            started = time.monotonic()
+            prober.probe_round()  # Waits at most the probe timeout for the new lookup
+            prober.probe_round()  # The hung lookup is neither resubmitted nor waited on
+            self.assertLess(time.monotonic() - started, 1.5)
+            self.assertEqual(calls.count('slow.example'), 1)
+            self.assertEqual(prober.histograms[('tcp', f"slow.example:{self.port}")].failures, 2)
+            self.assertEqual(prober.histograms[('tcp', f"127.0.0.1:{self.port}")].count, 2)
+
+            release.set()
+            prober.resolving[('slow.example', self.port)].result(timeout=5)
+            prober.probe_round()
+        self.assertEqual(prober.histograms[('tcp', f"slow.example:{self.port}")].count, 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,220 @@
+"""MetricsPusher payloads (remote-write and Influx line protocol) against a local HTTP sink"""
+
+import gzip
+import os
+import struct
+import tempfile
+import unittest
+
+from support import HTTPSink, load_metrics_server
+
+ms = load_metrics_server()
+
+def read_varint(data, i):
+    value = shift = 0
+    while True:
+        byte = data[i]
+        i += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, i
+
+def snappy_decompress(data):
+    """Reference snappy block decoder (literals and 1/2-byte-offset copies)"""
+    length, i = read_varint(data, 0)
+    out = bytearray()
+    while i < len(data):
+        tag = data[i]
+        i += 1
+        kind = tag & 3
+        if kind == 0:
+            size = tag >> 2
+            if size >= 60:
+                extra = size - 59
+                size = int.from_bytes(data[i:i + extra], 'little')
+                i += extra
+            size += 1
+            out += data[i:i + size]
+            i += size
+            continue
+        if kind == 1:
+            size = ((tag >> 2) & 7) + 4
+            offset = (tag >> 5) << 8 | data[i]
+            i += 1
+        else:
+            size = (tag >> 2) + 1
+            offset = int.from_bytes(data[i:i + 2], 'little')
+            i += 2
+        for _ in range(size):
+            out.append(out[-offset])
+    assert len(out) == length
+    return bytes(out)
+
+def protobuf_fields(data):
+    """Yield (field number, wire type, value) from a protobuf message"""
+    i = 0
+    while i < len(data):
+        key, i = read_varint(data, i)
+        number, wire = key >> 3, key & 7
+        if wire == 0:
+            value, i = read_varint(data, i)
+        elif wire == 1:
+            value, i = data[i:i + 8], i + 8
+        elif wire == 2:
+            size, i = read_varint(data, i)
+            value, i = data[i:i + size], i + size
+        else:
+            raise ValueError(f"unexpected wire type {wire}")
+        yield number, wire, value
+
+def decode_write_request(data):
+    """WriteRequest -> [(labels, value, timestamp_ms)]"""
+    series = []
+    for number, _, timeseries in protobuf_fields(data):
+        assert number == 1
+        labels, samples = {}, []
+        for field, _, payload in protobuf_fields(timeseries):
+            if field == 1:
+                label = {n: v.decode('utf-8') for n, _, v in protobuf_fields(payload)}
+                labels[label[1]] = label[2]
+            elif field == 2:
+                sample = {n: v for n, _, v in protobuf_fields(payload)}
+                samples.append((struct.unpack('<d', sample[1])[0], sample[2]))
+        for value, timestamp in samples:
+            series.append((labels, value, timestamp))
+    return series
+
+def collection():
+    metrics = ms.Exposition()
+    metrics.append("# HELP transmission_torrent_count Total number of torrents")
+    metrics.append("# TYPE transmission_torrent_count gauge")
+    metrics.sample("transmission_torrent_count", 12)
+    metrics.sample("transmission_tracker_seeders", 3.5, tracker='tracker.example, "eu"')
+    metrics.sample("transmission_torrent_no_progress_seconds", 600, id=7, name='Some Torrent', state='stalled')
+    return metrics
+
+class ExpositionTest(unittest.TestCase):
+    def test_text_is_rendered_from_the_samples(self):
+        metrics = collection()
+        self.assertEqual(metrics.text().splitlines(), [
+            "# HELP transmission_torrent_count Total number of torrents",
+            "# TYPE transmission_torrent_count gauge",
+            "transmission_torrent_count 12",
+            'transmission_tracker_seeders{tracker="tracker.example, \\"eu\\""} 3.5',
+            'transmission_torrent_no_progress_seconds{id="7",name="Some Torrent",state="stalled"} 600',
+        ])
+        self.assertEqual(len(metrics.samples), 3)
+
+    def test_extend_carries_samples(self):
+        metrics = ms.Exposition()
+        metrics.sample("a", 1)
+        metrics.extend(collection())
+        metrics.extend(["# plain text lines carry no samples"])
+        self.assertEqual([name for name, _, _ in metrics.samples],
+                         ["a", "transmission_torrent_count", "transmission_tracker_seeders",
+                          "transmission_torrent_no_progress_seconds"])
+
+class MetricsPusherTest(unittest.TestCase):
+    def setUp(self):
+        self.sink = HTTPSink()
+        self.addCleanup(self.sink.close)
+
+    def pusher(self, push_format, buffer_dir=''):
+        pusher = ms.MetricsPusher(url=f"{self.sink.url}/write", push_format=push_format, batch_size=1000,
+                                  flush_interval=60, buffer_dir=buffer_dir)
+        self.addCleanup(pusher.session.close)
+        return pusher
+
+    def test_remote_write_payload(self):
+        pusher = self.pusher('remote_write')
+        pusher.enqueue(collection().samples, timestamp=1700000000.25)
+        pusher.flush()
+
+        self.assertEqual(len(self.sink.requests), 1)
+        path, headers, body = self.sink.requests[0]
+        self.assertEqual(path, '/write')
+        self.assertEqual(headers['Content-Type'], 'application/x-protobuf')
+        self.assertEqual(headers['Content-Encoding'], 'snappy')
+        self.assertEqual(headers['X-Prometheus-Remote-Write-Version'], '0.1.0')
+
+        series = decode_write_request(snappy_decompress(body))
+        self.assertEqual(series, [
+            ({'__name__': 'transmission_torrent_count'}, 12.0, 1700000000250),
+            ({'__name__': 'transmission_tracker_seeders', 'tracker': 'tracker.example, "eu"'}, 3.5, 1700000000250),
+            ({'__name__': 'transmission_torrent_no_progress_seconds', 'id': '7', 'name': 'Some Torrent',
+              'state': 'stalled'}, 600.0, 1700000000250),
+        ])
+        self.assertEqual(pusher.stats['sent_samples'], 3)
+
+    def test_snappy_encoder_round_trips_repetitive_input(self):
+        data = b''.join(f'series_{i % 7}{{label="value"}} {i}\n'.encode() for i in range(20000))
+        self.assertGreater(len(data), 0x10000)  # Spans several snappy blocks
+        compressed = ms.snappy_compress(data)
+        self.assertLess(len(compressed), len(data) // 2)
+        self.assertEqual(snappy_decompress(compressed), data)
+
+    def test_influx_payload(self):
+        pusher = self.pusher('influx')
+        pusher.enqueue(collection().samples, timestamp=1700000000)
+        pusher.enqueue([("transmission_torrent_count", {}, float('nan'))], timestamp=1700000030)
+        pusher.flush()
+
+        self.assertEqual(len(self.sink.requests), 1)
+        _, headers, body = self.sink.requests[0]
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertTrue(headers['Content-Type'].startswith('text/plain'))
+        self.assertEqual(gzip.decompress(body).decode('utf-8').splitlines(), [
+            'prometheus,service=transmissionvpn,source=transmissionvpn transmission_torrent_count=12.0 1700000000000000000',
+            'prometheus,service=transmissionvpn,source=transmissionvpn,tracker=tracker.example\\,\\ "eu" '
+            'transmission_tracker_seeders=3.5 1700000000000000000',
+            'prometheus,id=7,name=Some\\ Torrent,service=transmissionvpn,source=transmissionvpn,state=stalled '
+            'transmission_torrent_no_progress_seconds=600.0 1700000000000000000',
+        ])
+
+    def test_failed_push_is_spooled_and_resent(self):
+        buffer_dir = tempfile.mkdtemp()
+        pusher = self.pusher('influx', buffer_dir=buffer_dir)
+        self.sink.status = 503
+        pusher.enqueue(collection().samples, timestamp=1700000000)
+        pusher.flush()
+        self.assertEqual(pusher.stats['failed_batches'], 1)
+        self.assertEqual(len(os.listdir(buffer_dir)), 1)
+
+        self.sink.status = 204
+        pusher.enqueue(collection().samples, timestamp=1700000030)
+        pusher.flush()
+        self.assertEqual(os.listdir(buffer_dir), [])
+        bodies = [gzip.decompress(body) for _, _, body in self.sink.requests[1:]]
+        self.assertEqual(len(bodies), 2)
+        self.assertIn(b' 1700000030000000000', bodies[0])
+        self.assertIn(b' 1700000000000000000', bodies[1])
+
+    def test_client_errors_are_dropped_not_spooled(self):
+        buffer_dir = tempfile.mkdtemp()
+        pusher = self.pusher('remote_write', buffer_dir=buffer_dir)
+        self.sink.status = 400
+        pusher.enqueue(collection().samples)
+        pusher.flush()
+        self.assertEqual(pusher.stats['dropped_batches'], 1)
+        self.assertEqual(pusher.stats['sent_samples'], 0)
+        self.assertEqual(os.listdir(buffer_dir), [])
+
+    def test_rejected_batch_does_not_drain_the_spool(self):
+        buffer_dir = tempfile.mkdtemp()
+        pusher = self.pusher('influx', buffer_dir=buffer_dir)
+        self.sink.status = 503
+        pusher.enqueue(collection().samples, timestamp=1700000000)
+        pusher.flush()
+
+        self.sink.status = 400
+        pusher.enqueue(collection().samples, timestamp=1700000030)
+        pusher.flush()
+        self.assertEqual(len(self.sink.requests), 2)  # No resend of the spooled batch
+        self.assertEqual(len(os.listdir(buffer_dir)), 1)
+        self.assertEqual(pusher.stats, {'sent_samples': 0, 'failed_batches': 1, 'spooled_batches': 1,
+                                        'dropped_batches': 1})
+        self.assertIn('transmissionvpn_push_samples_total 0', pusher.prometheus_lines().text())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+"""PeerCollector: per-torrent peer summaries and their bounded aggregation"""
+
+import unittest
+
+from support import load_metrics_server
+
+ms = load_metrics_server()
+
+def peer(client, encrypted=False, utp=False, incoming=False, down=0, up=0):
+    return {'clientName': client, 'isEncrypted': encrypted, 'isUTP': utp, 'isIncoming': incoming,
+            'rateToClient': down, 'rateToPeer': up}
+
+def torrent(torrent_id, peers, status=4):
+    return {'id': torrent_id, 'status': status, 'peersConnected': len(peers), 'peers': peers}
+
+class PeerCollectorTest(unittest.TestCase):
+    def test_client_versions_are_stripped(self):
+        self.assertEqual(ms.PeerCollector.client_name({'clientName': 'qBittorrent 4.6.2'}), 'qBittorrent')
+        self.assertEqual(ms.PeerCollector.client_name({'clientName': 'Transmission 4.0.6 (38c164933e)'}),
+                         'Transmission')
+        self.assertEqual(ms.PeerCollector.client_name({'clientName': 'µTorrent'}), 'µTorrent')
+        self.assertEqual(ms.PeerCollector.client_name({}), 'unknown')
+
+    def test_peers_are_aggregated_across_torrents(self):
+        collector = ms.PeerCollector()
+        collector.update([
+            torrent(1, [peer('qBittorrent 4.6.2', encrypted=True, down=100, up=10),
+                        peer('qBittorrent 4.5.0', encrypted=True, down=50)]),
+            torrent(2, [peer('qBittorrent 4.6.2', encrypted=True, up=5),
+                        peer('Deluge 2.1.1', utp=True, incoming=True, down=7)]),
+        ], {1, 2})
+        self.assertEqual(collector.aggregate, {
+            ('qBittorrent', 'yes', 'tcp', 'outgoing'): [3, 150, 15],
+            ('Deluge', 'no', 'utp', 'incoming'): [1, 7, 0],
+        })
+        text = collector.prometheus_lines().text()
+        self.assertIn('transmission_peer_connections{client="qBittorrent",encrypted="yes",transport="tcp",'
+                      'direction="outgoing"} 3', text)
+        self.assertIn('transmission_peer_rate_bytes_per_second{client="Deluge",encrypted="no",transport="utp",'
+                      'direction="incoming",flow="download"} 7', text)
+
+    def test_rare_clients_fold_into_other(self):
+        collector = ms.PeerCollector(max_clients=1)
+        collector.update([torrent(1, [peer('A 1'), peer('A 1'), peer('B 1'), peer('C 1')])], {1})
+        self.assertEqual(collector.aggregate, {('A', 'no', 'tcp', 'outgoing'): [2, 0, 0],
+                                               ('other', 'no', 'tcp', 'outgoing'): [2, 0, 0]})
+
+    def test_summaries_follow_refreshes_and_activity(self):
+        collector = ms.PeerCollector()
+        torrents = [torrent(1, [peer('A 1')]), torrent(2, [peer('B 1')])]
+        collector.update(torrents, {1, 2})
+
+        # Torrent 2 was not refetched this cycle: its cached summary is kept
+        torrents[0]['peers'] = [peer('A 1'), peer('A 1')]
+        torrents[1]['peers'] = []
+        collector.update(torrents, {1})
+        self.assertEqual(collector.summaries[1], {('A', 'no', 'tcp', 'outgoing'): [2, 0, 0]})
+        self.assertEqual(collector.summaries[2], {('B', 'no', 'tcp', 'outgoing'): [1, 0, 0]})
+
+        # A stopped torrent drops out of the aggregate and the coverage
+        torrents[1]['status'] = 0
+        collector.update(torrents, set())
+        self.assertEqual(list(collector.summaries), [1])
+        self.assertIn('transmission_peer_stats_coverage_ratio 1', collector.prometheus_lines().text())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+"""PIA port forwarding agent cycles against a stand-in gateway, token service and Transmission"""
+
+import base64
+import json
+import os
+import stat
+import tempfile
+import unittest
+from urllib.parse import urlparse, parse_qs
+
+from support import HTTPSink, load_port_forward_agent
+from transmission_rpc import TransmissionAPI
+
+pf = load_port_forward_agent()
+
+PORT = 41234
+PAYLOAD = base64.b64encode(json.dumps({'port': PORT, 'expires_at': '2099-01-01T00:00:00.000000000Z'}).encode()).decode()
+
+class StandIn:
+    """Routes the sink's requests to the token service, gateway or Transmission RPC"""
+
+    def __init__(self):
+        self.rpc = []
+        self.binds = 0
+
+    def __call__(self, request, body):
+        path = urlparse(request.path)
+        if path.path == '/generateToken':
+            return self.json(200, {'token': 'tok'})
+        if path.path == '/getSignature':
+            assert parse_qs(path.query) == {'token': ['tok']}
+            return self.json(200, {'status': 'OK', 'payload': PAYLOAD, 'signature': 'sig'})
+        if path.path == '/bindPort':
+            self.binds += 1
+            return self.json(200, {'status': 'OK', 'message': 'port scheduled for add'})
+        if request.headers.get('X-Transmission-Session-Id') != 'sid':
+            return 409, {'X-Transmission-Session-Id': 'sid'}, b''
+        method = json.loads(body)['method']
+        self.rpc.append(json.loads(body))
+        arguments = {'port-is-open': True} if method == 'port-test' else {}
+        return self.json(200, {'result': 'success', 'arguments': arguments})
+
+    @staticmethod
+    def json(status, data):
+        return status, {'Content-Type': 'application/json'}, json.dumps(data).encode()
+
+class Agent(pf.PortForwardAgent):
+    """Talks plain HTTP to the stand-in instead of the gateway's self-signed HTTPS"""
+
+    sink_url = None
+
+    def _gateway_url(self, path):
+        return f"{self.sink_url}/{path}"
+
+class PortForwardAgentTest(unittest.TestCase):
+    def setUp(self):
+        self.stand_in = StandIn()
+        self.sink = HTTPSink(self.stand_in)
+        self.addCleanup(self.sink.close)
+
+        self.dir = tempfile.mkdtemp()
+        self.calls = os.path.join(self.dir, 'killswitch.calls')
+        killswitch = os.path.join(self.dir, 'killswitch')
+        with open(killswitch, 'w') as f:
+            f.write(f'#!/bin/sh\necho "$@" >> {self.calls}\n')
+        os.chmod(killswitch, stat.S_IRWXU)
+
+        patched = {
+            'PIA_PF_GATEWAY': '127.0.0.1',
+            'PIA_TOKEN_URL': f"{self.sink.url}/generateToken",
+            'PIA_PF_KILLSWITCH': killswitch,
+            'PIA_PF_PORT_FILE': os.path.join(self.dir, 'port'),
+            'PIA_PF_STATE_FILE': os.path.join(self.dir, 'state.json'),
+            'PIA_PF_SIGNATURE_FILE': os.path.join(self.dir, 'signature.json'),
+            'PIA_PF_KILLSWITCH_STATUS': os.path.join(self.dir, 'killswitch_status'),
+        }
+        for name, value in patched.items():
+            self.addCleanup(setattr, pf, name, getattr(pf, name))
+            setattr(pf, name, value)
+
+    def agent(self):
+        agent = Agent(api=TransmissionAPI(url=f"{self.sink.url}/transmission/rpc", timeout=5))
+        agent.sink_url = self.sink.url
+        self.addCleanup(agent.session.close)
+        self.addCleanup(agent.api.session.close)
+        return agent
+
+    def killswitch_calls(self):
+        with open(self.calls) as f:
+            return f.read().splitlines()
+
+    def test_cycle_binds_applies_and_opens_the_port(self):
+        agent = self.agent()
+        delay = agent.cycle()
+        self.assertAlmostEqual(delay, pf.PIA_PF_BIND_INTERVAL, delta=5)
+        self.assertEqual(self.stand_in.binds, 1)
+        self.assertEqual([call['method'] for call in self.stand_in.rpc], ['session-set', 'port-test'])
+        self.assertEqual(self.stand_in.rpc[0]['arguments'], {'peer-port': PORT})
+        self.assertEqual(self.killswitch_calls(), [f"allow-peer-port {PORT}"])
+        with open(pf.PIA_PF_STATE_FILE) as f:
+            state = json.load(f)
+        self.assertEqual((state['port'], state['applied'], state['port_open']), (PORT, True, True))
+
+    def test_firewall_entry_is_reasserted_only_after_a_kill_switch_apply(self):
+        agent = self.agent()
+        agent.cycle()
+        agent.last_bind = 0
+        agent.cycle()
+        self.assertEqual(self.stand_in.binds, 2)
+        self.assertEqual(self.killswitch_calls(), [f"allow-peer-port {PORT}"])
+        # The peer port was applied once; rebinds do not repeat session-set
+        self.assertEqual([call['method'] for call in self.stand_in.rpc], ['session-set', 'port-test'])
+
+        # A full apply rewrites the status file
+        with open(pf.PIA_PF_KILLSWITCH_STATUS, 'w') as f:
+            f.write("active\n")
+        agent.cycle()
+        agent.cycle()
+        self.assertEqual(self.killswitch_calls(), [f"allow-peer-port {PORT}"] * 2)
+
+    def test_local_file_errors_are_retried_not_fatal(self):
+        pf.PIA_PF_PORT_FILE = os.path.join(self.dir, 'missing', 'port')
+        agent = self.agent()
+        delay = agent.cycle()
+        self.assertEqual(delay, 5)
+        self.assertEqual(agent.failures['state'], 1)
+        with open(pf.PIA_PF_STATE_FILE) as f:
+            self.assertEqual(json.load(f)['failures_total']['state'], 1)
+
+    def test_incomplete_saved_signature_is_ignored(self):
+        with open(pf.PIA_PF_SIGNATURE_FILE, 'w') as f:
+            json.dump({'gateway': '127.0.0.1', 'payload': PAYLOAD, 'renew_at': 4102444800}, f)
+        agent = self.agent()
+        agent.cycle()
+        self.assertEqual(agent.signature, 'sig')
+        self.assertEqual(agent.consecutive_failures, 0)
+
+    def test_saved_signature_is_reused(self):
+        self.agent().cycle()
+        token_requests = len([r for r in self.sink.requests if r[0] == '/generateToken'])
+        restarted = self.agent()
+        restarted.cycle()
+        self.assertEqual(len([r for r in self.sink.requests if r[0] == '/generateToken']), token_requests)
+        self.assertEqual(restarted.port, PORT)
+
+if __name__ == '__main__':
+    unittest.main()
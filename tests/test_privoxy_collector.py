@@ -0,0 +1,125 @@
+"""PrivoxyCollector: request line parsing and incremental log tailing"""
+
+import os
+import tempfile
+import unittest
+
+from support import load_metrics_server
+
+ms = load_metrics_server()
+
+# Lines as written with `debug 1` (plus the startup and error classes enabled in config/privoxy/config)
+LOG = """\
+2024-05-01 12:00:00.101 7f3c9a1fe700 Info: Privoxy version 3.0.34
+2024-05-01 12:00:00.102 7f3c9a1fe700 Info: Listening on port 8118 on IP address 0.0.0.0
+2024-05-01 12:00:01.210 7f3c98ffd700 Request: www.example.com/index.html
+2024-05-01 12:00:01.315 7f3c98ffd700 Request: www.example.com:443/
+2024-05-01 12:00:02.007 7f3c987fc700 Request: ads.example.net/banner.gif crunch! (Blocked)
+2024-05-01 12:00:02.118 7f3c987fc700 Request: [2001:db8::1]:443/
+2024-05-01 12:00:02.230 7f3c987fc700 Request: CDN.Example.ORG./lib.js
+2024-05-01 12:00:03.441 7f3c97ffb700 Request: config.privoxy.org/show-status crunch! (CGI Call)
+2024-05-01 12:00:03.502 7f3c97ffb700 Request: old.example.com/moved crunch! (Redirected)
+2024-05-01 12:00:03.613 7f3c97ffb700 Request: unreachable.example/ crunch! (Connection failure)
+2024-05-01 12:00:04.001 7f3c97ffb700 Error: Couldn't connect to unreachable.example
+"""
+
+class ParseRequestTest(unittest.TestCase):
+    def test_debug_1_lines(self):
+        parsed = [ms.PrivoxyCollector.parse_request(line) for line in LOG.splitlines()]
+        self.assertEqual(parsed, [
+            None,
+            None,
+            ('www.example.com', 'allowed'),
+            ('www.example.com', 'allowed'),
+            ('ads.example.net', 'blocked'),
+            ('2001:db8::1', 'allowed'),
+            ('cdn.example.org', 'allowed'),
+            ('config.privoxy.org', 'cgi'),
+            ('old.example.com', 'redirected'),
+            ('unreachable.example', 'refused'),
+            None,
+        ])
+
+    def test_empty_host(self):
+        self.assertEqual(ms.PrivoxyCollector.parse_request("2024-05-01 12:00:00.000 7f00 Request: /"),
+                         ('unknown', 'allowed'))
+
+class TailTest(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), 'privoxy.log')
+        with open(self.path, 'w') as f:
+            f.write("2024-05-01 12:00:00.000 7f00 Request: backlog.example/\n")
+
+    def append(self, text):
+        with open(self.path, 'a') as f:
+            f.write(text)
+
+    def collector(self, **kwargs):
+        collector = ms.PrivoxyCollector(path=self.path, **kwargs)
+        self.addCleanup(lambda: collector.file and collector.file.close())
+        return collector
+
+    def test_counts_only_appended_lines(self):
+        collector = self.collector()
+        collector.collect()
+        self.assertEqual(collector.results, {})  # Backlog before the first run is skipped
+        self.append(LOG)
+        collector.collect()
+        self.assertEqual(collector.results, {'allowed': 4, 'blocked': 1, 'cgi': 1, 'redirected': 1, 'refused': 1})
+        self.assertEqual(collector.domains['www.example.com'], 2)
+
+    def test_partial_line_waits_for_its_newline(self):
+        collector = self.collector()
+        collector.collect()
+        self.append("2024-05-01 12:00:00.000 7f00 Request: split.exa")
+        collector.collect()
+        self.assertEqual(collector.results, {})
+        self.append("mple/\n")
+        collector.collect()
+        self.assertEqual(collector.domains, {'split.example': 1})
+
+    def test_truncation_is_read_from_the_start(self):
+        collector = self.collector()
+        collector.collect()
+        self.append(LOG)
+        collector.collect()
+        with open(self.path, 'w') as f:
+            f.write("2024-05-01 12:00:00.000 7f00 Request: after.example/\n")
+        collector.collect()
+        self.assertEqual(collector.rotations, 1)
+        self.assertEqual(collector.domains['after.example'], 1)
+
+    def test_rename_drains_the_old_file(self):
+        collector = self.collector()
+        collector.collect()
+        self.append("2024-05-01 12:00:00.000 7f00 Request: before.example/\n")
+        os.rename(self.path, self.path + '.1')
+        with open(self.path, 'w') as f:
+            f.write("2024-05-01 12:00:00.000 7f00 Request: new.example/\n")
+        collector.collect()
+        self.assertEqual(collector.domains, {'before.example': 1, 'new.example': 1})
+        self.assertEqual(collector.rotations, 1)
+
+    def test_restart_resumes_from_the_saved_offset(self):
+        collector = self.collector()
+        collector.collect()
+        self.append(LOG)
+        collector.collect()
+        state = collector.dump_state()
+
+        self.append("2024-05-01 12:00:00.000 7f00 Request: later.example/\n")
+        restarted = self.collector()
+        restarted.load_state(state)
+        restarted.collect()
+        self.assertEqual(restarted.domains['later.example'], 1)
+        self.assertEqual(sum(restarted.results.values()), 9)
+
+    def test_domains_beyond_the_cap_fold_into_other(self):
+        collector = self.collector(max_domains=2)
+        collector.collect()
+        self.append("".join(f"2024-05-01 12:00:00.000 7f00 Request: d{i}.example/\n" for i in range(4)))
+        collector.collect()
+        self.assertEqual(collector.domains, {'d0.example': 1, 'd1.example': 1, 'other': 2})
+
+if __name__ == '__main__':
+    unittest.main()
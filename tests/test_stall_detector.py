@@ -0,0 +1,64 @@
+"""StallDetector classification, hash-keyed state and the escalation ladder"""
+
+import unittest
+
+from support import load_metrics_server
+
+ms = load_metrics_server()
+
+class RecordingAPI:
+    def __init__(self):
+        self.requests = []
+
+    def _make_request(self, method, arguments=None):
+        self.requests.append((method, arguments))
+        return {'result': 'success', 'arguments': {}}
+
+def downloading(torrent_id, info_hash, left, peers=0):
+    return {'id': torrent_id, 'hashString': info_hash, 'name': f"t{torrent_id}", 'status': 4,
+            'leftUntilDone': left, 'peersConnected': peers}
+
+class StallDetectorTest(unittest.TestCase):
+    def detector(self):
+        return ms.StallDetector(window=60, dead_after=120, slow_rate=1, actions=['reannounce', 'stop'],
+                                max_actions=5, cooldown=0)
+
+    def test_restored_state_follows_the_hash_after_renumbering(self):
+        detector = self.detector()
+        detector.update([downloading(1, 'aa', 1000), downloading(2, 'bb', 1000)])
+        detector.torrents['aa'][2] = detector.torrents['aa'][3] = 0  # 'aa' long stuck
+
+        restarted = self.detector()
+        restarted.load_state(detector.dump_state())
+        restarted.update([downloading(1, 'bb', 1000), downloading(2, 'aa', 1000)])
+        self.assertEqual(restarted.classified, {'aa': 'dead'})
+
+        api = RecordingAPI()
+        restarted.act(api)
+        self.assertEqual(api.requests, [('torrent-reannounce', {'ids': ['aa']})])
+        lines = restarted.prometheus_lines().text()
+        self.assertIn('transmission_torrent_no_progress_seconds{id="2",name="t2",state="dead"}', lines)
+
+    def test_id_keyed_state_from_older_versions_is_dropped(self):
+        detector = self.detector()
+        detector.load_state({'1': [0, 1000, 0, 0, 0, 1000, None, 0, 0]})
+        detector.update([downloading(1, 'aa', 1000)])
+        self.assertEqual(list(detector.torrents), ['aa'])
+        self.assertEqual(detector.classified, {})
+
+    def test_progress_resets_the_ladder(self):
+        detector = self.detector()
+        detector.update([downloading(1, 'aa', 1000)])
+        detector.torrents['aa'][2] = detector.torrents['aa'][3] = 0
+        detector.update([downloading(1, 'aa', 1000)])
+        api = RecordingAPI()
+        detector.act(api)
+        detector.act(api)
+        self.assertEqual([method for method, _ in api.requests], ['torrent-reannounce', 'torrent-stop'])
+
+        detector.update([downloading(1, 'aa', 900)])
+        self.assertEqual(detector.torrents['aa'][7], 0)
+        self.assertEqual(detector.classified, {})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+"""StateStore persistence and the torrent table it restores"""
+
+import os
+import tempfile
+import unittest
+
+from support import load_metrics_server
+
+ms = load_metrics_server()
+
+class FakeAPI:
+    """torrent-get over an in-memory {id: torrent} table"""
+
+    def __init__(self, torrents):
+        self.torrents = torrents
+        self.calls = []
+
+    def get_torrents(self, fields=None, ids=None):
+        self.calls.append((fields, ids))
+        rows = []
+        for torrent_id, torrent in sorted(self.torrents.items()):
+            if ids is None or torrent_id in ids:
+                rows.append(dict({f: torrent[f] for f in fields if f in torrent}, id=torrent_id))
+        return {'result': 'success', 'arguments': {'torrents': rows}}
+
+def torrent(info_hash, name, rate=0, cold='x'):
+    return {'hashString': info_hash, 'name': name, 'rateDownload': rate, 'status': 4, 'comment': cold}
+
+class StateStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), 'state.bin')
+
+    def scheduler(self):
+        return ms.TorrentFieldScheduler(hot=['rateDownload', 'status'], warm=['name'], cold=['comment'],
+                                        warm_every=5, cold_shards=1, state_shards=4)
+
+    def store(self, scheduler, dumps=None):
+        store = ms.StateStore(self.path)
+        for shard in range(4):
+            def dump(shard=shard):
+                if dumps is not None:
+                    dumps.append(shard)
+                return scheduler.dump_state(shard)
+            store.register(f'torrents.{shard}', dump, scheduler.load_state,
+                           lambda shard=shard: scheduler.state_version(shard))
+        return store
+
+    def test_restored_rows_follow_the_hash_not_the_id(self):
+        scheduler = self.scheduler()
+        store = self.store(scheduler)
+        store.load()
+        scheduler.refresh(FakeAPI({1: torrent('aa', 'Alpha', cold='alpha'), 2: torrent('bb', 'Beta', cold='beta')}))
+        store.save()
+        store.mm.close()
+
+        # After a daemon restart the ids are swapped
+        restarted = self.scheduler()
+        self.assertTrue(self.store(restarted).load())
+        api = FakeAPI({1: torrent('bb', 'Beta', cold='beta'), 2: torrent('aa', 'Alpha', cold='alpha')})
+        rows = {row['id']: row for row in restarted.refresh(api)}
+        self.assertEqual((rows[1]['hashString'], rows[1]['name'], rows[1]['comment']), ('bb', 'Beta', 'beta'))
+        self.assertEqual((rows[2]['hashString'], rows[2]['name'], rows[2]['comment']), ('aa', 'Alpha', 'alpha'))
+
+    def test_removed_torrents_are_not_resurrected(self):
+        scheduler = self.scheduler()
+        store = self.store(scheduler)
+        store.load()
+        scheduler.refresh(FakeAPI({1: torrent('aa', 'Alpha'), 2: torrent('bb', 'Beta')}))
+        store.save()
+        store.mm.close()
+
+        restarted = self.scheduler()
+        self.store(restarted).load()
+        rows = restarted.refresh(FakeAPI({1: torrent('bb', 'Beta')}))
+        self.assertEqual([row['hashString'] for row in rows], ['bb'])
+        self.assertEqual(restarted.restored, {})
+
+    def test_hot_only_changes_write_nothing(self):
+        torrents = {i: torrent(f"{i:040x}", f"t{i}") for i in range(1, 41)}
+        api = FakeAPI(torrents)
+        scheduler = self.scheduler()
+        dumps = []
+        store = self.store(scheduler, dumps)
+        store.load()
+        scheduler.refresh(api)
+        store.save()
+        generation = store.generation
+        self.assertEqual(sorted(dumps), [0, 1, 2, 3])
+
+        # Rates change every tick but are not persisted: no section is even serialized
+        dumps.clear()
+        for tick in range(3):
+            for t in torrents.values():
+                t['rateDownload'] += 100
+            scheduler.refresh(api)
+            store.save()
+        self.assertEqual(dumps, [])
+        self.assertEqual(store.generation, generation)
+
+    def test_slow_field_change_rewrites_only_its_shard(self):
+        torrents = {i: torrent(f"{i:040x}", f"t{i}") for i in range(1, 41)}
+        api = FakeAPI(torrents)
+        scheduler = self.scheduler()
+        dumps = []
+        store = self.store(scheduler, dumps)
+        store.load()
+        scheduler.refresh(api)
+        store.save()
+
+        dumps.clear()
+        torrents[7]['name'] = 'renamed'
+        for _ in range(5):  # Up to and including the next warm tick
+            scheduler.refresh(api)
+        store.save()
+        self.assertEqual(dumps, [scheduler.state_shard(torrents[7]['hashString'])])
+
+    def test_older_format_versions_are_ignored(self):
+        store = ms.StateStore(self.path)
+        store.register('core', lambda: {'a': 1}, lambda state: None)
+        store.load()
+        store.HEADER.pack_into(store.mm, 0, store.MAGIC, 1, 0, 0)
+        store.mm.close()
+
+        restored = []
+        reopened = ms.StateStore(self.path)
+        reopened.register('core', lambda: {}, restored.append)
+        self.assertFalse(reopened.load())
+        self.assertEqual(restored, [])
+
+class TorrentFieldSchedulerTest(unittest.TestCase):
+    def scheduler(self):
+        return ms.TorrentFieldScheduler(hot=['status'], warm=['name'], cold=['comment', 'peers'],
+                                        warm_every=5, cold_shards=4, state_shards=1)
+
+    def test_cold_fields_rotate_by_shard_and_new_torrents_get_them_at_once(self):
+        torrents = {i: dict(torrent(f"{i:040x}", f"t{i}"), peers=[]) for i in range(1, 9)}
+        scheduler = self.scheduler()
+        scheduler.refresh(FakeAPI(torrents))
+        self.assertEqual(scheduler.cold_ids, set(torrents))
+
+        api = FakeAPI(torrents)
+        scheduler.refresh(api)
+        self.assertEqual(scheduler.cold_ids, {1, 5})
+        torrents[9] = torrent('ff' * 20, 'new')
+        scheduler.refresh(api, due_ids=[3, 42])
+        self.assertEqual(scheduler.cold_ids, {2, 3, 6, 9})
+        self.assertEqual(api.calls[-1], (['id', 'comment', 'peers'], [2, 3, 6, 9]))
+
+    def test_peer_lists_are_neither_persisted_nor_rewrite_shards(self):
+        torrents = {1: dict(torrent('aa', 'Alpha'), peers=[{'clientName': 'x'}])}
+        scheduler = self.scheduler()
+        scheduler.refresh(FakeAPI(torrents))
+        version = scheduler.state_version(0)
+        torrents[1]['peers'] = [{'clientName': 'y'}]
+        for _ in range(4):
+            scheduler.refresh(FakeAPI(torrents))
+        self.assertEqual(scheduler.table[1]['peers'], [{'clientName': 'y'}])
+        self.assertEqual(scheduler.state_version(0), version)
+        self.assertEqual(scheduler.dump_state(0), {'aa': {'name': 'Alpha', 'comment': 'x'}})
+
+if __name__ == '__main__':
+    unittest.main()
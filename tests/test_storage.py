@@ -0,0 +1,38 @@
+"""StorageCollector forecast slope and time-to-full"""
+
+import tempfile
+import unittest
+
+from support import load_metrics_server
+
+ms = load_metrics_server()
+
+class StorageForecastTest(unittest.TestCase):
+    def test_slope_of_a_linear_series(self):
+        history = [(1000 + t, 10000 - 50 * t) for t in range(0, 60, 10)]
+        self.assertAlmostEqual(ms.StorageCollector.forecast_slope(history), -50)
+
+    def test_slope_needs_three_distinct_times(self):
+        self.assertIsNone(ms.StorageCollector.forecast_slope([(0, 10), (1, 5)]))
+        self.assertIsNone(ms.StorageCollector.forecast_slope([(5, 10), (5, 8), (5, 6)]))
+
+    def test_time_to_full_from_pending_downloads(self):
+        path = tempfile.mkdtemp()
+        storage = ms.StorageCollector([path], path)
+        storage.collect(left_until_done=1, download_rate=1000)
+        # The remaining bytes fit on the disk: the download finishes before it fills
+        self.assertEqual(storage.mounts[path]['seconds_until_full'], float('inf'))
+
+        free = storage.mounts[path]['free_bytes']
+        storage.collect(left_until_done=free * 10, download_rate=1000)
+        self.assertAlmostEqual(storage.mounts[path]['seconds_until_full'],
+                               storage.mounts[path]['free_bytes'] / 1000, delta=1)
+
+    def test_idle_mount_never_fills(self):
+        path = tempfile.mkdtemp()
+        storage = ms.StorageCollector([path], path)
+        storage.collect()
+        self.assertEqual(storage.mounts[path]['seconds_until_full'], float('inf'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+"""TrackerCollector: announce counting, host pruning and announce-due refetches"""
+
+import unittest
+
+from support import load_metrics_server
+
+ms = load_metrics_server()
+
+def stat(tracker_id, announce, last, succeeded=True, next_announce=0):
+    return {'id': tracker_id, 'announce': announce, 'lastAnnounceTime': last, 'lastAnnounceSucceeded': succeeded,
+            'nextAnnounceTime': next_announce, 'seederCount': 5, 'leecherCount': 2, 'announceState': 1}
+
+class TrackerCollectorTest(unittest.TestCase):
+    def test_first_sight_sets_the_baseline(self):
+        collector = ms.TrackerCollector()
+        torrents = [{'id': 1, 'trackerStats': [stat(0, 'https://tracker.example/announce', 1000)]}]
+        collector.update(torrents, {1})
+        self.assertEqual(collector.announces, {})
+
+        torrents[0]['trackerStats'] = [stat(0, 'https://tracker.example/announce', 2800, succeeded=False)]
+        collector.update(torrents, {1})
+        collector.update(torrents, {1})  # Same timestamp: not counted again
+        self.assertEqual(collector.announces, {'tracker.example': {'success': 0, 'failure': 1}})
+        self.assertIn('transmission_tracker_announces_total{tracker="tracker.example",result="failure"} 1',
+                      collector.prometheus_lines().text())
+
+    def test_unrefreshed_rows_are_not_reread(self):
+        collector = ms.TrackerCollector()
+        torrents = [{'id': 1, 'trackerStats': [stat(0, 'udp://a.example:6969', 1000)]}]
+        collector.update(torrents, set())  # Restored row, first sight
+        torrents[0]['trackerStats'] = [stat(0, 'udp://a.example:6969', 2000)]
+        collector.update(torrents, set())
+        self.assertEqual(collector.last_fetch_count, 0)
+        self.assertEqual(collector.announces, {})
+
+    def test_hosts_of_removed_torrents_are_pruned(self):
+        collector = ms.TrackerCollector()
+        torrents = [{'id': 1, 'trackerStats': [stat(0, 'udp://a.example:6969', 1000)]},
+                    {'id': 2, 'trackerStats': [stat(0, 'udp://b.example:6969', 1000)]}]
+        collector.update(torrents, {1, 2})
+        for torrent in torrents:
+            torrent['trackerStats'][0]['lastAnnounceTime'] = 2000
+        collector.update(torrents, {1, 2})
+        self.assertEqual(set(collector.announces), {'a.example', 'b.example'})
+
+        collector.update(torrents[:1], set())
+        self.assertEqual(set(collector.announces), {'a.example'})
+        self.assertEqual(set(collector.hosts), {'a.example'})
+
+    def test_due_announces_are_refetched(self):
+        collector = ms.TrackerCollector()
+        collector.update([{'id': 1, 'trackerStats': [stat(0, 'udp://a.example:6969', 1000, next_announce=1500)]},
+                          {'id': 2, 'trackerStats': [stat(0, 'udp://a.example:6969', 1000, next_announce=9000)]}],
+                         {1, 2})
+        self.assertEqual(collector.due_ids(now=2000), [1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+"""TransferCounters: priming, deltas, counter resets and label folding"""
+
+import unittest
+
+from support import load_metrics_server
+
+ms = load_metrics_server()
+
+def transfer(info_hash, downloaded, uploaded=0, status=4, labels=None, tracker=None):
+    return {'hashString': info_hash, 'downloadedEver': downloaded, 'uploadedEver': uploaded, 'status': status,
+            'labels': labels or [], 'trackers': [{'announce': f"http://{tracker}/announce"}] if tracker else []}
+
+class TransferCountersTest(unittest.TestCase):
+    def test_first_cycle_only_primes(self):
+        counters = ms.TransferCounters()
+        counters.update([transfer('aa', 1000, 500)])
+        self.assertEqual(counters.by_status, {})
+        counters.update([transfer('aa', 1500, 800)])
+        self.assertEqual(counters.by_status, {'downloading': [500, 300]})
+        self.assertEqual(counters.by_label, {'none': [500, 300]})
+        self.assertEqual(counters.by_tracker, {'none': [500, 300]})
+
+    def test_torrent_added_after_priming_counts_in_full(self):
+        counters = ms.TransferCounters()
+        counters.update([transfer('aa', 1000)])
+        counters.update([transfer('aa', 1000), transfer('bb', 700, labels=['tv'])])
+        self.assertEqual(counters.by_label, {'tv': [700, 0]})
+
+    def test_counter_going_backwards_counts_from_zero(self):
+        counters = ms.TransferCounters()
+        counters.update([transfer('aa', 5000, 2000)])
+        counters.update([transfer('aa', 300, 2500)])
+        self.assertEqual(counters.resets, 1)
+        self.assertEqual(counters.by_status, {'downloading': [300, 500]})
+
+    def test_keyed_by_hash_across_id_renumbering(self):
+        counters = ms.TransferCounters()
+        counters.update([dict(transfer('aa', 100), id=1), dict(transfer('bb', 9000), id=2)])
+        counters.update([dict(transfer('bb', 9000), id=1), dict(transfer('aa', 150), id=2)])
+        self.assertEqual(counters.resets, 0)
+        self.assertEqual(counters.by_status, {'downloading': [50, 0]})
+
+    def test_labels_beyond_the_cap_fold_into_other(self):
+        counters = ms.TransferCounters(max_labels=2)
+        counters.update([])
+        counters.update([transfer(f"{i:02x}", 10, labels=[f"l{i}"], tracker=f"t{i}.example") for i in range(4)])
+        self.assertEqual(counters.by_label, {'l0': [10, 0], 'l1': [10, 0], 'other': [20, 0]})
+        self.assertEqual(counters.by_tracker, {'t0.example': [10, 0], 't1.example': [10, 0], 'other': [20, 0]})
+
+    def test_restored_state_is_primed(self):
+        counters = ms.TransferCounters()
+        counters.update([transfer('aa', 1000)])
+        restored = ms.TransferCounters()
+        restored.load_state(counters.dump_state())
+        restored.update([transfer('aa', 1200)])
+        self.assertEqual(restored.by_status, {'downloading': [200, 0]})
+
+if __name__ == '__main__':
+    unittest.main()